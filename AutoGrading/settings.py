@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 import os
 import os.path
 from pathlib import Path
+from urllib.parse import unquote, urlparse
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
@@ -81,12 +82,58 @@ WSGI_APPLICATION = 'AutoGrading.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# SQLite by default, tuned so the bot and grader_job can write concurrently:
+# WAL lets readers run alongside the writer, IMMEDIATE transactions take the
+# write lock up front instead of failing on upgrade, and the timeout makes
+# writers wait for the lock rather than raise "database is locked".
+# Set DATABASE_URL=postgresql://... to use PostgreSQL with a connection pool.
+DATABASE_URL = urlparse(os.getenv('DATABASE_URL', 'sqlite:///db.sqlite3'))
+DATABASE_CONN_MAX_AGE = int(os.getenv('DATABASE_CONN_MAX_AGE', '60'))  # seconds a connection is reused
+DATABASE_POOL = os.getenv('DATABASE_POOL', 'True').lower() == 'true'  # PostgreSQL only, needs psycopg[pool]
+DATABASE_POOL_MIN_SIZE = int(os.getenv('DATABASE_POOL_MIN_SIZE', '2'))
+DATABASE_POOL_MAX_SIZE = int(os.getenv('DATABASE_POOL_MAX_SIZE', '10'))
+SQLITE_BUSY_TIMEOUT = int(os.getenv('SQLITE_BUSY_TIMEOUT', '20'))  # seconds a writer waits for the lock
+
+if DATABASE_URL.scheme in ('postgres', 'postgresql'):
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': DATABASE_URL.path.lstrip('/'),
+            'USER': unquote(DATABASE_URL.username or ''),
+            'PASSWORD': unquote(DATABASE_URL.password or ''),
+            'HOST': DATABASE_URL.hostname or '',
+            'PORT': str(DATABASE_URL.port or ''),
+            # A pool replaces persistent connections, Django rejects using both
+            'CONN_MAX_AGE': 0 if DATABASE_POOL else DATABASE_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'pool': {
+                    'min_size': DATABASE_POOL_MIN_SIZE,
+                    'max_size': DATABASE_POOL_MAX_SIZE,
+                },
+            } if DATABASE_POOL else {},
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            # sqlite:///db.sqlite3 is relative to BASE_DIR, sqlite:////var/lib/db.sqlite3 is absolute
+            'NAME': BASE_DIR / (DATABASE_URL.path[1:] or 'db.sqlite3'),
+            'CONN_MAX_AGE': DATABASE_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'init_command': (
+                    'PRAGMA journal_mode=WAL;'
+                    'PRAGMA synchronous=NORMAL;'
+                    'PRAGMA temp_store=MEMORY;'
+                    'PRAGMA mmap_size=134217728;'
+                ),
+                'transaction_mode': 'IMMEDIATE',
+                'timeout': SQLITE_BUSY_TIMEOUT,
+            },
+        }
     }
-}
 
 
 # Password validation
@@ -138,7 +185,84 @@ TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
 if not TELEGRAM_BOT_TOKEN:
     raise ValueError("TELEGRAM_BOT_TOKEN environment variable is required")
 
+# Grading backend: 'browser' drives the ChatGPT web UI, 'api' calls an OpenAI-compatible endpoint
+GRADING_BACKEND = os.getenv('GRADING_BACKEND', 'browser')
+GRADING_API_URL = os.getenv('GRADING_API_URL', 'https://api.openai.com/v1')
+GRADING_API_KEY = os.getenv('GRADING_API_KEY', '')
+GRADING_API_MODEL = os.getenv('GRADING_API_MODEL', 'gpt-4o-mini')
+GRADING_API_TIMEOUT = float(os.getenv('GRADING_API_TIMEOUT', '120'))
+GRADING_MAX_IN_FLIGHT = int(os.getenv('GRADING_MAX_IN_FLIGHT', '8'))  # concurrent API requests
+GRADING_BATCH_SIZE = int(os.getenv('GRADING_BATCH_SIZE', '1'))  # submissions of one assignment per prompt
+GRADING_BROWSER_RESPONSE_TIMEOUT = float(os.getenv('GRADING_BROWSER_RESPONSE_TIMEOUT', '180'))  # seconds per reply
+GRADING_BROWSER_QUIET_PERIOD = float(os.getenv('GRADING_BROWSER_QUIET_PERIOD', '1.0'))  # unchanged page = reply done
+GRADING_BROWSER_SESSIONS = int(os.getenv('GRADING_BROWSER_SESSIONS', '1'))  # parallel Chrome instances
+GRADING_BROWSER_MAX_FAILURES = int(os.getenv('GRADING_BROWSER_MAX_FAILURES', '3'))  # in a row, then retired
+GRADING_BROWSER_RESTART_DELAY = float(os.getenv('GRADING_BROWSER_RESTART_DELAY', '300'))  # seconds, then relaunched
+
 # Chrome/Selenium configuration
 CHROME_DRIVER_PATH = os.path.join(BASE_DIR, os.getenv('CHROME_DRIVER_PATH', 'chromedriver-mac-arm64/chromedriver'))
 CHROME_PATH = os.getenv('CHROME_PATH', '/Applications/Google Chrome.app/Contents/MacOS/Google Chrome')
 
+# Canvas configuration
+CANVAS_ROSTER_TTL = int(os.getenv('CANVAS_ROSTER_TTL', '900'))  # seconds a course roster stays cached
+
+# Canvas course/assignment metadata cache; set the alias to a CACHES entry to share it between processes
+CANVAS_METADATA_CACHE_TTL = int(os.getenv('CANVAS_METADATA_CACHE_TTL', '3600'))
+CANVAS_METADATA_CACHE_SIZE = int(os.getenv('CANVAS_METADATA_CACHE_SIZE', '1024'))
+CANVAS_METADATA_CACHE_ALIAS = os.getenv('CANVAS_METADATA_CACHE_ALIAS', '')
+
+# Bulk grade posting: the bot only approves grades and grader_job posts them per assignment
+CANVAS_BATCH_GRADE_POSTING = os.getenv('CANVAS_BATCH_GRADE_POSTING', 'False').lower() == 'true'
+CANVAS_GRADE_BATCH_SIZE = int(os.getenv('CANVAS_GRADE_BATCH_SIZE', '200'))
+CANVAS_PROGRESS_POLL_INTERVAL = float(os.getenv('CANVAS_PROGRESS_POLL_INTERVAL', '2'))
+# Seconds grader_job waits inline for a bulk update; unfinished ones are checked again next cycle
+CANVAS_PROGRESS_TIMEOUT = float(os.getenv('CANVAS_PROGRESS_TIMEOUT', '10'))
+
+# Keep-alive connection pool of each long-lived Canvas client
+CANVAS_POOL_CONNECTIONS = int(os.getenv('CANVAS_POOL_CONNECTIONS', '4'))
+CANVAS_POOL_MAXSIZE = int(os.getenv('CANVAS_POOL_MAXSIZE', '10'))  # keep >= GRADER_INGEST_WORKERS_PER_PLATFORM
+
+# On-disk cache of Canvas GET responses, revalidated with ETag/Last-Modified; empty (default) disables it.
+# Cached bodies include student submissions, so keep the directory private.
+CANVAS_HTTP_CACHE_DIR = os.getenv('CANVAS_HTTP_CACHE_DIR', '')
+CANVAS_HTTP_CACHE_MAX_AGE = int(os.getenv('CANVAS_HTTP_CACHE_MAX_AGE', str(7 * 24 * 3600)))
+CANVAS_HTTP_CACHE_MAX_ENTRIES = int(os.getenv('CANVAS_HTTP_CACHE_MAX_ENTRIES', '10000'))
+
+# Canvas rate limiting: quota units kept free for higher-priority calls (grade posts > admin > sync)
+CANVAS_RATE_LIMIT_ADMIN_RESERVE = float(os.getenv('CANVAS_RATE_LIMIT_ADMIN_RESERVE', '50'))
+CANVAS_RATE_LIMIT_SYNC_RESERVE = float(os.getenv('CANVAS_RATE_LIMIT_SYNC_RESERVE', '200'))
+CANVAS_RATE_LIMIT_LOW_WATER = float(os.getenv('CANVAS_RATE_LIMIT_LOW_WATER', '300'))  # start backing off below this
+CANVAS_RATE_LIMIT_REFILL = float(os.getenv('CANVAS_RATE_LIMIT_REFILL', '10'))  # quota units regained per second
+CANVAS_RATE_LIMIT_MAX_DELAY = float(os.getenv('CANVAS_RATE_LIMIT_MAX_DELAY', '30'))
+CANVAS_RATE_LIMIT_RETRIES = int(os.getenv('CANVAS_RATE_LIMIT_RETRIES', '5'))
+
+# Grader job configuration
+GRADER_INGEST_WORKERS = int(os.getenv('GRADER_INGEST_WORKERS', '1'))  # 1 keeps ingestion sequential
+GRADER_INGEST_WORKERS_PER_PLATFORM = int(os.getenv('GRADER_INGEST_WORKERS_PER_PLATFORM', '4'))
+GRADER_INGEST_CHUNK_SIZE = int(os.getenv('GRADER_INGEST_CHUNK_SIZE', '500'))  # submissions per bulk insert
+GRADER_EVENT_POLL_INTERVAL = float(os.getenv('GRADER_EVENT_POLL_INTERVAL', '10'))  # seconds between scheduler ticks
+GRADER_PIPELINE = os.getenv('GRADER_PIPELINE', 'False').lower() == 'true'  # staged ingest/grade/notify
+GRADER_PIPELINE_GRADE_QUEUE_SIZE = int(os.getenv('GRADER_PIPELINE_GRADE_QUEUE_SIZE', '20'))
+GRADER_PIPELINE_NOTIFY_QUEUE_SIZE = int(os.getenv('GRADER_PIPELINE_NOTIFY_QUEUE_SIZE', '50'))
+GRADER_WORKER_ID = os.getenv('GRADER_WORKER_ID', '')  # empty = hostname:pid
+GRADER_LEASE_SECONDS = int(os.getenv('GRADER_LEASE_SECONDS', '900'))  # must cover a whole claimed batch
+GRADER_CLAIM_BATCH_SIZE = int(os.getenv('GRADER_CLAIM_BATCH_SIZE', '5'))
+GRADER_MAX_ATTEMPTS = int(os.getenv('GRADER_MAX_ATTEMPTS', '5'))  # then the submission is marked failed
+GRADER_RETRY_BASE_DELAY = int(os.getenv('GRADER_RETRY_BASE_DELAY', '60'))  # seconds, doubled per attempt
+GRADER_RETRY_MAX_DELAY = int(os.getenv('GRADER_RETRY_MAX_DELAY', '21600'))
+
+# Adaptive per-assignment polling (all values in seconds)
+GRADER_POLL_MIN_INTERVAL = int(os.getenv('GRADER_POLL_MIN_INTERVAL', '300'))  # around the due date
+GRADER_POLL_DEFAULT_INTERVAL = int(os.getenv('GRADER_POLL_DEFAULT_INTERVAL', '3600'))  # quiet open assignments
+GRADER_POLL_MAX_INTERVAL = int(os.getenv('GRADER_POLL_MAX_INTERVAL', '86400'))  # closed assignments
+GRADER_POLL_DEADLINE_WINDOW = int(os.getenv('GRADER_POLL_DEADLINE_WINDOW', str(24 * 3600)))
+GRADER_POLL_CLOSED_AFTER = int(os.getenv('GRADER_POLL_CLOSED_AFTER', str(7 * 24 * 3600)))
+GRADER_POLL_RATE_WINDOW = int(os.getenv('GRADER_POLL_RATE_WINDOW', str(6 * 3600)))  # for the arrival rate
+
+# Shared secret Canvas live events must send as "Authorization: Bearer <token>"
+CANVAS_EVENTS_TOKEN = os.getenv('CANVAS_EVENTS_TOKEN')
+
+# Admin course/assignment dropdowns: served from the cache and refreshed in the background once stale
+ADMIN_CHOICES_FRESH_SECONDS = int(os.getenv('ADMIN_CHOICES_FRESH_SECONDS', '300'))
+ADMIN_CHOICES_CACHE_TTL = int(os.getenv('ADMIN_CHOICES_CACHE_TTL', '86400'))
+ADMIN_CHOICES_PAGE_SIZE = int(os.getenv('ADMIN_CHOICES_PAGE_SIZE', '50'))
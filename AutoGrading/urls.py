@@ -18,12 +18,13 @@ from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
-from auto_grader.views import get_courses_for_platform, get_assignments_for_course
+from auto_grader.views import get_courses_for_platform, get_assignments_for_course, canvas_submission_event
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/courses/', get_courses_for_platform, name='get_courses_for_platform'),
     path('api/assignments/', get_assignments_for_course, name='get_assignments_for_course'),
+    path('api/canvas/events/', canvas_submission_event, name='canvas_submission_event'),
 ]
 
 if settings.DEBUG:
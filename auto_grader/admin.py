@@ -5,7 +5,7 @@ from django.shortcuts import render
 from django.utils.html import format_html
 from django.db.models import Count
 from django import forms
-from .models import Assignment, Submission, User, Platform, RubricGrade, SubmissionStatus
+from .models import Assignment, Submission, User, Platform, RubricGrade, SubmissionStatus, SubmissionEvent
 
 class AssignmentAdminForm(forms.ModelForm):
     class Meta:
@@ -40,7 +40,7 @@ class RubricGradeAdmin(admin.ModelAdmin):
 
 class AssignmentAdmin(admin.ModelAdmin):
     form = AssignmentAdminForm
-    list_display = ['assignment_id', 'course_id', 'platform', 'user', 'last_retrieved', 'submission_stats', 'rubric_grade_count', 'has_rubric']
+    list_display = ['assignment_id', 'course_id', 'platform', 'user', 'last_retrieved', 'grading_priority', 'grading_weight', 'submission_stats', 'rubric_grade_count', 'has_rubric']
     list_filter = ['platform', 'user', 'last_retrieved']
     search_fields = ['assignment_id', 'course_id', 'description']
     readonly_fields = ['last_retrieved']
@@ -83,18 +83,27 @@ class AssignmentAdmin(admin.ModelAdmin):
     reset_last_retrieved.short_description = 'Reset last_retrieved timestamp'
 
 class SubmissionAdmin(admin.ModelAdmin):
-    list_display = ['student_name', 'assignment', 'grade', 'status', 'submission_time', 'similarity_score', 'status_display']
+    list_display = ['student_name', 'assignment', 'grade', 'status', 'submission_time', 'similarity_score', 'attempts', 'status_display']
     list_filter = ['assignment', 'status', 'submission_time', 'grade']
     search_fields = ['student_name', 'student_id', 'student_uid', 'content']
-    readonly_fields = ['submission_time']
-    actions = ['reset_to_new', 'mark_as_graded']
+    readonly_fields = [
+        'submission_time', 'claimed_by', 'lease_expires_at', 'attempts', 'next_attempt_at', 'last_error',
+        'grade_progress_id',
+    ]
+    actions = ['reset_to_new', 'mark_as_graded', 'requeue_failed', 'retry_posting']
     
     def status_display(self, obj):
         status_colors = {
             SubmissionStatus.NEW: 'blue',
+            SubmissionStatus.GRADING: 'steelblue',
             SubmissionStatus.GRADED: 'green', 
+            SubmissionStatus.NOTIFYING: 'darkgreen',
             SubmissionStatus.VERIFICATION_SENT: 'orange',
-            SubmissionStatus.GRADE_POSTED: 'purple'
+            SubmissionStatus.APPROVED: 'teal',
+            SubmissionStatus.POSTING: 'slateblue',
+            SubmissionStatus.POST_FAILED: 'darkred',
+            SubmissionStatus.GRADE_POSTED: 'purple',
+            SubmissionStatus.FAILED: 'red'
         }
         color = status_colors.get(obj.status, 'gray')
         return format_html(
@@ -104,14 +113,31 @@ class SubmissionAdmin(admin.ModelAdmin):
     status_display.short_description = 'Status'
     
     def reset_to_new(self, request, queryset):
-        updated = queryset.update(status=SubmissionStatus.NEW, grade=None, feedback='')
+        updated = queryset.update(
+            status=SubmissionStatus.NEW, grade=None, feedback='', claimed_by=None, lease_expires_at=None,
+            attempts=0, next_attempt_at=None, last_error='',
+        )
         self.message_user(request, f'{updated} submissions reset to NEW status for re-grading.')
     reset_to_new.short_description = 'Reset selected submissions to NEW status'
     
     def mark_as_graded(self, request, queryset):
-        updated = queryset.update(status=SubmissionStatus.GRADED)
+        updated = queryset.update(status=SubmissionStatus.GRADED, claimed_by=None, lease_expires_at=None)
         self.message_user(request, f'{updated} submissions marked as GRADED.')
     mark_as_graded.short_description = 'Mark selected submissions as GRADED'
+    
+    def requeue_failed(self, request, queryset):
+        updated = queryset.filter(status=SubmissionStatus.FAILED).update(
+            status=SubmissionStatus.NEW, attempts=0, next_attempt_at=None, last_error=''
+        )
+        self.message_user(request, f'{updated} failed submissions requeued for grading.')
+    requeue_failed.short_description = 'Requeue selected failed submissions'
+
+    def retry_posting(self, request, queryset):
+        updated = queryset.filter(status=SubmissionStatus.POST_FAILED).update(
+            status=SubmissionStatus.APPROVED, grade_progress_id=None, last_error=''
+        )
+        self.message_user(request, f'{updated} submissions queued for posting again. Check Canvas for comments that were already added.')
+    retry_posting.short_description = 'Retry posting selected grades that failed to post'
 
 class UserAdmin(admin.ModelAdmin):
     list_display = ['username', 'first_name', 'last_name', 'user_id', 'assignment_count']
@@ -154,6 +180,12 @@ class PlatformAdmin(admin.ModelAdmin):
         self.message_user(request, 'Connection test initiated for selected platforms.')
     test_connection.short_description = 'Test API connection'
 
+class SubmissionEventAdmin(admin.ModelAdmin):
+    list_display = ['event_name', 'assignment', 'student_nid', 'received_at', 'processed_at']
+    list_filter = ['event_name', 'assignment', 'processed_at']
+    search_fields = ['student_nid', 'assignment__assignment_id']
+    readonly_fields = ['received_at']
+
 class AutoGradingAdminSite(admin.AdminSite):
     site_header = 'AutoGrading Admin'
     site_title = 'AutoGrading Admin Portal'
@@ -172,9 +204,15 @@ class AutoGradingAdminSite(admin.AdminSite):
         # Status-based submission counts
         submission_stats = {
             'new': Submission.objects.filter(status=SubmissionStatus.NEW).count(),
+            'grading': Submission.objects.filter(status=SubmissionStatus.GRADING).count(),
             'graded': Submission.objects.filter(status=SubmissionStatus.GRADED).count(),
+            'notifying': Submission.objects.filter(status=SubmissionStatus.NOTIFYING).count(),
             'verification_sent': Submission.objects.filter(status=SubmissionStatus.VERIFICATION_SENT).count(),
+            'approved': Submission.objects.filter(status=SubmissionStatus.APPROVED).count(),
+            'posting': Submission.objects.filter(status=SubmissionStatus.POSTING).count(),
+            'post_failed': Submission.objects.filter(status=SubmissionStatus.POST_FAILED).count(),
             'grade_posted': Submission.objects.filter(status=SubmissionStatus.GRADE_POSTED).count(),
+            'failed': Submission.objects.filter(status=SubmissionStatus.FAILED).count(),
         }
         
         # Assignment stats
@@ -202,9 +240,11 @@ admin.site.register(Submission, SubmissionAdmin)
 admin.site.register(User, UserAdmin)
 admin.site.register(Platform, PlatformAdmin)
 admin.site.register(RubricGrade, RubricGradeAdmin)
+admin.site.register(SubmissionEvent, SubmissionEventAdmin)
 
 admin_site.register(Assignment, AssignmentAdmin)
 admin_site.register(Submission, SubmissionAdmin)
 admin_site.register(User, UserAdmin)
 admin_site.register(Platform, PlatformAdmin)
 admin_site.register(RubricGrade, RubricGradeAdmin)
+admin_site.register(SubmissionEvent, SubmissionEventAdmin)
@@ -0,0 +1,279 @@
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.conf import settings
+
+
+class BackendUnavailable(Exception):
+    """
+    The backend as a whole cannot grade right now (outage, rate limit, no
+    browser left), as opposed to a failure caused by one prompt.
+    """
+
+
+class GradingBackend:
+    """
+    Engine that turns a grading prompt into the model's reply.
+
+    Subclasses implement grade(). concurrency tells grader_job how many
+    prompts the backend can work on at once; grade_many() runs a batch of
+    prompts with at most that many in flight.
+    """
+
+    name = None
+    concurrency = 1
+
+    def start(self):
+        """Prepare the backend before the first prompt"""
+
+    def grade(self, prompt):
+        """
+        Args:
+            prompt: Full grading prompt
+
+        Returns:
+            str: The model's reply
+
+        Raises:
+            BackendUnavailable: If the failure is not the prompt's fault
+        """
+        raise NotImplementedError
+
+    def grade_many(self, prompts):
+        """
+        Grade several prompts.
+
+        Returns:
+            list with the reply of each prompt, or the exception it raised, in prompt order
+        """
+        if self.concurrency <= 1 or len(prompts) <= 1:
+            return [self._grade_or_error(prompt) for prompt in prompts]
+        with ThreadPoolExecutor(max_workers=min(self.concurrency, len(prompts))) as executor:
+            return list(executor.map(self._grade_or_error, prompts))
+
+    def _grade_or_error(self, prompt):
+        try:
+            return self.grade(prompt)
+        except Exception as e:
+            return e
+
+    def health(self):
+        """Lines describing the state of the backend, for the job log"""
+        return []
+
+    def close(self):
+        """Release the resources held by the backend"""
+
+
+class BrowserSession:
+    """One ChatGPT browser of the pool and its health"""
+
+    def __init__(self, index, gpt):
+        self.index = index
+        self.gpt = gpt
+        self.failures = 0
+        self.graded = 0
+        self.healthy = True
+        self.retired_at = None
+
+    def __str__(self):
+        state = 'healthy' if self.healthy else 'retired'
+        return f"session {self.index} ({state}, {self.graded} graded, {self.failures} consecutive failures)"
+
+
+class BrowserGradingBackend(GradingBackend):
+    """
+    Grades through the ChatGPT web UI driven by Selenium.
+
+    Runs a pool of browser sessions, each a separate Chrome instance with its
+    own debugging port and profile directory, and grades one prompt per
+    session at a time. A session that fails is reloaded; after max_failures
+    consecutive failures it is retired and the remaining sessions carry on.
+    A retired session is relaunched from its profile restart_delay seconds
+    later, so a temporary ChatGPT problem does not end grading for good.
+
+    Args:
+        chrome_path: Chrome executable
+        chrome_driver_path: chromedriver executable
+        sessions: Number of browser sessions to run
+        max_failures: Consecutive failures after which a session is retired
+        restart_delay: Seconds before a retired session is relaunched
+    """
+
+    name = 'browser'
+
+    def __init__(self, chrome_path, chrome_driver_path, sessions=1, max_failures=3, restart_delay=300):
+        self.chrome_path = chrome_path
+        self.chrome_driver_path = chrome_driver_path
+        self.session_count = max(1, sessions)
+        self.max_failures = max_failures
+        self.restart_delay = restart_delay
+        self.sessions = []
+        self.idle = queue.Queue()
+        self.restart_lock = threading.Lock()
+
+    def launch(self, index, interactive=True):
+        """Open the Chrome instance of session index on ChatGPT"""
+        # Imported here so API-only deployments don't need selenium
+        from auto_grader.gpt import ChatGPTAutomation
+
+        gpt = ChatGPTAutomation(
+            self.chrome_path,
+            self.chrome_driver_path,
+            response_timeout=settings.GRADING_BROWSER_RESPONSE_TIMEOUT,
+            response_quiet_period=settings.GRADING_BROWSER_QUIET_PERIOD,
+            # The first session keeps the original profile and its login
+            profile_dir='remote-profile' if index == 0 else f'remote-profile-{index}',
+            interactive=interactive,
+        )
+        gpt.open_chatgpt()
+        return gpt
+
+    def start(self):
+        for index in range(self.session_count):
+            print(f"Starting browser session {index + 1} of {self.session_count}")
+            session = BrowserSession(index, self.launch(index))
+            self.sessions.append(session)
+            self.idle.put(session)
+        self.concurrency = len(self.sessions)
+
+    def restart_retired(self):
+        """Relaunch the sessions that have been retired for at least restart_delay seconds"""
+        with self.restart_lock:
+            for session in self.sessions:
+                if session.healthy or time.monotonic() - session.retired_at < self.restart_delay:
+                    continue
+                print(f"Restarting browser {session}")
+                try:
+                    # The profile is already logged in; nobody is there to confirm a verification
+                    session.gpt = self.launch(session.index, interactive=False)
+                except Exception as e:
+                    print(f"Error restarting browser {session}: {e}")
+                    session.retired_at = time.monotonic()
+                    continue
+                session.healthy = True
+                session.failures = 0
+                session.retired_at = None
+                self.idle.put(session)
+
+    def checkout(self):
+        """Wait for an idle healthy session"""
+        while True:
+            self.restart_retired()
+            if not any(session.healthy for session in self.sessions):
+                raise BackendUnavailable("All browser sessions are retired")
+            try:
+                return self.idle.get(timeout=5)
+            except queue.Empty:
+                continue
+
+    def grade(self, prompt):
+        session = self.checkout()
+        try:
+            session.gpt.send_prompt_to_chatgpt(prompt)
+            response = session.gpt.return_last_response()
+            session.gpt.open_chatgpt()
+            session.failures = 0
+            session.graded += 1
+            return response
+        except Exception:
+            self.record_failure(session)
+            raise
+        finally:
+            if session.healthy:
+                self.idle.put(session)
+
+    def record_failure(self, session):
+        """Reload a failing session, or retire it after max_failures failures in a row"""
+        session.failures += 1
+        if session.failures >= self.max_failures:
+            session.healthy = False
+            session.retired_at = time.monotonic()
+            print(f"Retiring browser {session}")
+            session.gpt.quit()
+            return
+        try:
+            session.gpt.open_chatgpt()
+        except Exception as e:
+            print(f"Error reloading browser {session}: {e}")
+
+    def health(self):
+        """One line per session describing its state"""
+        return [str(session) for session in self.sessions]
+
+    def close(self):
+        for session in self.sessions:
+            if session.healthy:
+                session.gpt.quit()
+
+
+class APIGradingBackend(GradingBackend):
+    """
+    Grades through an OpenAI-compatible chat completions endpoint, with up to
+    max_in_flight requests running at once.
+
+    Args:
+        api_url: Base URL of the API, e.g. https://api.openai.com/v1
+        api_key: Bearer token, may be empty for local servers
+        model: Model name sent with every request
+        max_in_flight: Maximum concurrent requests
+        timeout: Seconds to wait for a single reply
+    """
+
+    name = 'api'
+
+    def __init__(self, api_url, api_key, model, max_in_flight, timeout):
+        self.url = f"{api_url.rstrip('/')}/chat/completions"
+        self.model = model
+        self.timeout = timeout
+        self.concurrency = max(1, max_in_flight)
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=self.concurrency)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        if api_key:
+            self.session.headers['Authorization'] = f'Bearer {api_key}'
+
+    def grade(self, prompt):
+        try:
+            response = self.session.post(
+                self.url,
+                json={
+                    'model': self.model,
+                    'messages': [{'role': 'user', 'content': prompt}],
+                },
+                timeout=self.timeout,
+            )
+        except (requests.ConnectionError, requests.Timeout) as e:
+            raise BackendUnavailable(f"Grading API unreachable: {e}") from e
+        if response.status_code == 429 or response.status_code >= 500:
+            raise BackendUnavailable(f"Grading API returned {response.status_code}")
+        response.raise_for_status()
+        return response.json()['choices'][0]['message']['content'].strip()
+
+    def close(self):
+        self.session.close()
+
+
+def get_grading_backend():
+    """Build the backend selected by GRADING_BACKEND"""
+    if settings.GRADING_BACKEND == 'api':
+        return APIGradingBackend(
+            api_url=settings.GRADING_API_URL,
+            api_key=settings.GRADING_API_KEY,
+            model=settings.GRADING_API_MODEL,
+            max_in_flight=settings.GRADING_MAX_IN_FLIGHT,
+            timeout=settings.GRADING_API_TIMEOUT,
+        )
+    if settings.GRADING_BACKEND == 'browser':
+        return BrowserGradingBackend(
+            settings.CHROME_PATH,
+            settings.CHROME_DRIVER_PATH,
+            sessions=settings.GRADING_BROWSER_SESSIONS,
+            max_failures=settings.GRADING_BROWSER_MAX_FAILURES,
+            restart_delay=settings.GRADING_BROWSER_RESTART_DELAY,
+        )
+    raise ValueError(f"Unknown GRADING_BACKEND: {settings.GRADING_BACKEND}")
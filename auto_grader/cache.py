@@ -0,0 +1,113 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import caches
+
+
+class TTLCache:
+    """
+    Small thread-safe in-process cache whose entries expire after a fixed time.
+
+    Args:
+        ttl: Lifetime of an entry in seconds
+        maxsize: Optional bound on the number of entries; least recently used ones are evicted first
+    """
+
+    def __init__(self, ttl, maxsize=None):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """Return the cached value for key, or default if it is missing or expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        """Store value under key for the next ttl seconds"""
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            if self.maxsize is not None:
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+
+    def delete(self, key):
+        """Drop key from the cache if present"""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        """Drop every entry"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Hit/miss counters and current size"""
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self._entries)}
+
+
+class DjangoTTLCache:
+    """
+    TTLCache interface on top of one of Django's configured caches, so entries
+    can be shared between the web server, the bot and grader_job.
+
+    Args:
+        ttl: Lifetime of an entry in seconds
+        alias: Name of the cache in settings.CACHES
+        prefix: Namespace for the keys of this cache
+    """
+
+    def __init__(self, ttl, alias, prefix):
+        self.ttl = ttl
+        self.cache = caches[alias]
+        self.prefix = prefix
+        self.hits = 0
+        self.misses = 0
+
+    def _key(self, key):
+        # The generation lets clear() drop every key of this namespace at once
+        generation = self.cache.get_or_set(f'{self.prefix}:generation', 0, None)
+        parts = key if isinstance(key, tuple) else (key,)
+        return ':'.join([self.prefix, str(generation)] + [str(part) for part in parts])
+
+    def get(self, key, default=None):
+        """Return the cached value for key, or default if it is missing or expired"""
+        value = self.cache.get(self._key(key))
+        if value is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return value
+
+    def set(self, key, value):
+        """Store value under key for the next ttl seconds"""
+        self.cache.set(self._key(key), value, self.ttl)
+
+    def delete(self, key):
+        """Drop key from the cache if present"""
+        self.cache.delete(self._key(key))
+
+    def clear(self):
+        """Drop every entry of this namespace"""
+        generation = self.cache.get_or_set(f'{self.prefix}:generation', 0, None)
+        self.cache.set(f'{self.prefix}:generation', generation + 1, None)
+
+    def stats(self):
+        """Hit/miss counters"""
+        return {'hits': self.hits, 'misses': self.misses}
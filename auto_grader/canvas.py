@@ -1,36 +1,200 @@
+import hashlib
+import threading
+import time
+from datetime import timezone as dt_timezone
+
 from canvasapi import Canvas
+from canvasapi.assignment import Assignment as CanvasAssignment
+from canvasapi.course import Course as CanvasCourse
+from canvasapi.submission import Submission as CanvasSubmission
 from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from requests.adapters import HTTPAdapter
 
-from auto_grader.models import Assignment, User
+from auto_grader.cache import DjangoTTLCache, TTLCache
+from auto_grader.httpcache import ConditionalCacheAdapter
+from auto_grader.models import Assignment
+from auto_grader.ratelimit import CanvasPriority, canvas_priority, governor_for, install_governor
 from auto_grader.utils import clean_html_text
 
 
+def credentials_fingerprint(api_url, api_key):
+    """Short stable hash of a Canvas URL and token, safe to use in cache keys"""
+    return hashlib.sha256(f'{api_url} {api_key}'.encode()).hexdigest()[:16]
+
+
+def aware_datetime(value):
+    """Treat naive datetimes (e.g. the default last_retrieved) as UTC"""
+    if timezone.is_naive(value):
+        return timezone.make_aware(value, dt_timezone.utc)
+    return value
+
+
+class StudentDirectory:
+    """
+    Per-course roster of Canvas students, loaded in one paginated pass.
+
+    Rosters are cached for CANVAS_ROSTER_TTL seconds. A submission from a user
+    missing in the cached roster means enrollments changed, so the roster is
+    reloaded once; users still missing after that are fetched individually.
+    """
+
+    def __init__(self, ttl=None):
+        self.rosters = TTLCache(settings.CANVAS_ROSTER_TTL if ttl is None else ttl)
+
+    def load_roster(self, canvas_course):
+        """Fetch every student of the course and index them by Canvas user ID"""
+        students = canvas_course.get_users(enrollment_type=['student'], per_page=100)
+        return {student.id: student for student in students}
+
+    def roster(self, canvas_course):
+        """
+        Return the cached roster of a course, loading it if needed.
+
+        :return: tuple of (students by user ID, whether it was already reloaded for a miss)
+        """
+        roster = self.rosters.get(canvas_course.id)
+        if roster is None:
+            roster = (self.load_roster(canvas_course), False)
+            self.rosters.set(canvas_course.id, roster)
+        return roster
+
+    def get_student(self, canvas_course, user_id):
+        """Look up a student of the course without a per-student request when possible"""
+        students, reloaded = self.roster(canvas_course)
+        if user_id in students:
+            return students[user_id]
+
+        if not reloaded:
+            # Enrollment changed since the roster was loaded
+            students = self.load_roster(canvas_course)
+            self.rosters.set(canvas_course.id, (students, True))
+            if user_id in students:
+                return students[user_id]
+
+        # Not a regular student enrollment (e.g. test student); remember it for this roster
+        student = canvas_course.get_user(user_id)
+        students[user_id] = student
+        return student
+
+    def invalidate(self, course_id=None):
+        """Forget the roster of one course, or of every course if course_id is None"""
+        if course_id is None:
+            self.rosters.clear()
+        else:
+            self.rosters.delete(course_id)
+
+
 class CanvasGrader:
     def __init__(self, api_url, api_key):
         self.canvas = Canvas(api_url, api_key)
+        self.requester = self.canvas._Canvas__requester
+        # Keep-alive pool shared by every thread using this client
+        pool_sizes = {
+            'pool_connections': settings.CANVAS_POOL_CONNECTIONS,
+            'pool_maxsize': settings.CANVAS_POOL_MAXSIZE,
+        }
+        if settings.CANVAS_HTTP_CACHE_DIR:
+            adapter = ConditionalCacheAdapter(
+                settings.CANVAS_HTTP_CACHE_DIR,
+                settings.CANVAS_HTTP_CACHE_MAX_AGE,
+                max_entries=settings.CANVAS_HTTP_CACHE_MAX_ENTRIES,
+                **pool_sizes,
+            )
+        else:
+            adapter = HTTPAdapter(**pool_sizes)
+        self.requester._session.mount('https://', adapter)
+        self.requester._session.mount('http://', adapter)
+        install_governor(self.requester, governor_for(api_url, api_key))
+        self.students = StudentDirectory()
+        self.metadata = self.build_metadata_cache(api_url, api_key)
+
+    @staticmethod
+    def build_metadata_cache(api_url, api_key):
+        """Course/assignment cache, in-process unless CANVAS_METADATA_CACHE_ALIAS names a Django cache"""
+        if settings.CANVAS_METADATA_CACHE_ALIAS:
+            return DjangoTTLCache(
+                settings.CANVAS_METADATA_CACHE_TTL,
+                settings.CANVAS_METADATA_CACHE_ALIAS,
+                prefix=f'canvas-metadata:{credentials_fingerprint(api_url, api_key)}',
+            )
+        return TTLCache(settings.CANVAS_METADATA_CACHE_TTL, maxsize=settings.CANVAS_METADATA_CACHE_SIZE)
+
+    def cache_object(self, key, canvas_object):
+        """Store the attributes of a canvasapi object; the requester is re-attached on the way out"""
+        attributes = {name: value for name, value in vars(canvas_object).items() if name != '_requester'}
+        self.metadata.set(key, attributes)
+
+    def cached_object(self, key, cls):
+        """Rebuild a canvasapi object from the metadata cache, or return None on a miss"""
+        attributes = self.metadata.get(key)
+        if attributes is None:
+            return None
+        canvas_object = cls.__new__(cls)
+        canvas_object.__dict__.update(attributes)
+        canvas_object._requester = self.requester
+        return canvas_object
+
+    def get_course(self, course_id):
+        """Canvas course object, served from the metadata cache when possible"""
+        canvas_course = self.cached_object(('course', int(course_id)), CanvasCourse)
+        if canvas_course is None:
+            canvas_course = self.canvas.get_course(course_id)
+            self.cache_object(('course', int(course_id)), canvas_course)
+        return canvas_course
+
+    def get_assignments(self, canvas_course, assignment_ids):
+        """
+        Canvas assignment objects of one course by ID, fetching only the ones not cached
+        in a single request.
+        """
+        canvas_assignments = {}
+        missing = []
+        for assignment_id in assignment_ids:
+            canvas_assignment = self.cached_object(('assignment', canvas_course.id, assignment_id), CanvasAssignment)
+            if canvas_assignment is None:
+                missing.append(assignment_id)
+            else:
+                canvas_assignments[assignment_id] = canvas_assignment
+        if missing:
+            for canvas_assignment in canvas_course.get_assignments(assignment_ids=missing):
+                self.cache_object(('assignment', canvas_course.id, canvas_assignment.id), canvas_assignment)
+                canvas_assignments[canvas_assignment.id] = canvas_assignment
+        return canvas_assignments
+
+    def get_assignment(self, canvas_course, assignment_id):
+        """Single Canvas assignment object, served from the metadata cache when possible"""
+        key = ('assignment', canvas_course.id, assignment_id)
+        canvas_assignment = self.cached_object(key, CanvasAssignment)
+        if canvas_assignment is None:
+            canvas_assignment = canvas_course.get_assignment(assignment_id)
+            self.cache_object(key, canvas_assignment)
+        return canvas_assignment
     
     def get_courses(self):
         """Get all courses available in Canvas"""
         try:
-            courses = self.canvas.get_courses()
-            return [(course.id, f"{course.name} (ID: {course.id})") for course in courses if hasattr(course, 'name')]
+            with canvas_priority(CanvasPriority.ADMIN):
+                courses = self.canvas.get_courses()
+                return [(course.id, f"{course.name} (ID: {course.id})") for course in courses if hasattr(course, 'name')]
         except Exception as e:
             return []
     
     def get_assignments_for_course(self, course_id):
         """Get all assignments for a specific course"""
         try:
-            course = self.canvas.get_course(course_id)
-            assignments = course.get_assignments()
-            return [(assignment.id, f"{assignment.name} (ID: {assignment.id})") for assignment in assignments if hasattr(assignment, 'name')]
+            with canvas_priority(CanvasPriority.ADMIN):
+                course = self.get_course(course_id)
+                assignments = course.get_assignments()
+                return [(assignment.id, f"{assignment.name} (ID: {assignment.id})") for assignment in assignments if hasattr(assignment, 'name')]
         except Exception as e:
             return []
 
     def retrieve_all_new_submissions(self):
-        users = User.objects.all()
-        for user in users:
-            for submission in self.retrieve_all_new_submissions_for_user(user):
-                yield submission
+        assignments = Assignment.objects.filter(user__isnull=False)
+        for submission in self.retrieve_new_submissions_for_assignments(assignments):
+            yield submission
 
     def send_grade(self, course_id, assignment_id, student_nid, grade, feedback):
         """
@@ -43,35 +207,156 @@ class CanvasGrader:
             grade: Numerical grade value from rubric
             feedback: Feedback text to post as comment
         """
-        canvas_course = self.canvas.get_course(course_id)
-        canvas_assignment = canvas_course.get_assignment(assignment_id)
-        canvas_student = canvas_course.get_user(student_nid)
-        canvas_submission = canvas_assignment.get_submission(canvas_student.id)
-        
-        # Post the numerical grade directly
-        canvas_submission.edit(submission={'posted_grade': int(grade)})
-        
-        # Add feedback comment if provided
+        # The submission endpoint only needs the IDs, so no lookups are required before the write
+        canvas_submission = CanvasSubmission(self.requester, {
+            'course_id': course_id,
+            'assignment_id': assignment_id,
+            'user_id': student_nid,
+        })
+        changes = {'submission': {'posted_grade': int(grade)}}
         if feedback:
-            canvas_submission.edit(comment={'text_comment': feedback})
+            changes['comment'] = {'text_comment': feedback}
+
+        with canvas_priority(CanvasPriority.GRADE_POST):
+            canvas_submission.edit(**changes)
+
+    def start_grade_update(self, course_id, assignment_id, grades):
+        """
+        Post grades and comments for many students of one assignment in a single
+        bulk update. Canvas applies it in the background.
+
+        Args:
+            course_id: Canvas course ID
+            assignment_id: Canvas assignment ID
+            grades: dict mapping Canvas student numeric ID to (grade, feedback)
+
+        Returns:
+            int: ID of the Canvas Progress tracking the update
+        """
+        grade_data = {}
+        for student_nid, (grade, feedback) in grades.items():
+            grade_data[student_nid] = {'posted_grade': int(grade)}
+            if feedback:
+                grade_data[student_nid]['text_comment'] = feedback
+
+        canvas_assignment = CanvasAssignment(self.requester, {'id': assignment_id, 'course_id': course_id})
+        with canvas_priority(CanvasPriority.GRADE_POST):
+            return canvas_assignment.submissions_bulk_update(grade_data=grade_data).id
+
+    def grade_update_state(self, progress_id, timeout=0):
+        """
+        Wait up to timeout seconds for a bulk grade update to finish.
+
+        Args:
+            progress_id: ID returned by start_grade_update
+            timeout: Seconds to keep polling; 0 checks the state once
+
+        Returns:
+            str: 'completed', 'failed', or the Canvas state of an update still running
+        """
+        deadline = time.monotonic() + timeout
+        with canvas_priority(CanvasPriority.GRADE_POST):
+            progress = self.canvas.get_progress(progress_id)
+            while progress.workflow_state not in ('completed', 'failed') and time.monotonic() < deadline:
+                time.sleep(settings.CANVAS_PROGRESS_POLL_INTERVAL)
+                progress = progress.query()
+
+        if progress.workflow_state == 'failed':
+            print(f"Bulk grade update {progress_id} failed: {getattr(progress, 'message', '')}")
+        return progress.workflow_state
 
     def retrieve_all_new_submissions_for_user(self, user):
         assignments = Assignment.objects.filter(user=user)
+        for submission in self.retrieve_new_submissions_for_assignments(assignments):
+            yield submission
+
+    @staticmethod
+    def group_assignments_by_course(assignments):
+        """Group Assignment rows by course_id so each course costs a single submissions stream"""
+        courses = {}
         for assignment in assignments:
-            for submission in self.retrieve_all_new_submissions_for_assignment(assignment):
+            courses.setdefault(assignment.course_id, []).append(assignment)
+        return courses
+
+    def retrieve_new_submissions_for_assignments(self, assignments):
+        courses = self.group_assignments_by_course(assignments)
+        for course_id, course_assignments in courses.items():
+            for submission in self.retrieve_all_new_submissions_for_course(course_id, course_assignments):
                 yield submission
 
     def retrieve_all_new_submissions_for_assignment(self, assignment):
-        canvas_course = self.canvas.get_course(assignment.course_id)
-        canvas_assignment = canvas_course.get_assignment(assignment.assignment_id)
+        for submission in self.retrieve_all_new_submissions_for_course(assignment.course_id, [assignment]):
+            yield submission
+
+    def retrieve_all_new_submissions_for_course(self, course_id, assignments):
+        """
+        Retrieve new submissions for several assignments of one course in one stream.
+
+        The stream starts at the oldest last_retrieved of the given assignments;
+        each submission is then checked against the cutoff of its own assignment.
+
+        Args:
+            course_id: Canvas course ID
+            assignments: Assignment rows that belong to this course
+        """
+        watermarks = {}
+        for assignment in assignments:
+            last_retrieved = aware_datetime(assignment.last_retrieved)
+            if assignment.assignment_id in watermarks:
+                last_retrieved = min(last_retrieved, watermarks[assignment.assignment_id])
+            watermarks[assignment.assignment_id] = last_retrieved
+        if not watermarks:
+            return
+
+        canvas_course = self.get_course(course_id)
+        canvas_assignments = self.get_assignments(canvas_course, list(watermarks))
         submission_generator = self.retrieve_remaining_submissions(
             canvas_course,
-            [assignment.assignment_id],
-            assignment.last_retrieved
+            list(watermarks),
+            min(watermarks.values())
         )
         for submission in submission_generator:
+            cutoff = watermarks.get(submission.assignment_id)
+            if cutoff is None:
+                continue
+            submitted_at = getattr(submission, 'submitted_at_date', None)
+            if submitted_at is not None and submitted_at < cutoff:
+                continue
+            canvas_assignment = canvas_assignments.get(submission.assignment_id)
+            if canvas_assignment is None:
+                canvas_assignment = self.get_assignment(canvas_course, submission.assignment_id)
+                canvas_assignments[submission.assignment_id] = canvas_assignment
             yield self.gradable_submission(canvas_course, canvas_assignment, submission)
 
+    def get_due_dates(self, assignments):
+        """
+        Due dates of the given Assignment rows, from the metadata cache where possible.
+
+        Returns:
+            dict mapping Canvas assignment ID to an aware datetime or None
+        """
+        due_dates = {}
+        for course_id, course_assignments in self.group_assignments_by_course(assignments).items():
+            canvas_course = self.get_course(course_id)
+            assignment_ids = [assignment.assignment_id for assignment in course_assignments]
+            for assignment_id, canvas_assignment in self.get_assignments(canvas_course, assignment_ids).items():
+                due_dates[assignment_id] = getattr(canvas_assignment, 'due_at_date', None)
+        return due_dates
+
+    def retrieve_submission(self, assignment, student_nid):
+        """
+        Fetch one student's submission to an assignment, e.g. after a Canvas event.
+
+        Returns:
+            GradableSubmission, or None if the student has not submitted
+        """
+        canvas_course = self.get_course(assignment.course_id)
+        canvas_assignment = self.get_assignment(canvas_course, assignment.assignment_id)
+        submission = canvas_assignment.get_submission(student_nid)
+        if not getattr(submission, 'submitted_at', None):
+            return None
+        return self.gradable_submission(canvas_course, canvas_assignment, submission)
+
     def retrieve_remaining_submissions(self, canvas_course, assignment_ids, time):
         """
         Retrieve submissions for a given assignment since specified time
@@ -90,10 +375,33 @@ class CanvasGrader:
             yield submission
 
     def gradable_submission(self, canvas_course, canvas_assignment, canvas_submission):
-        student = canvas_course.get_user(canvas_submission.user_id)
+        student = self.students.get_student(canvas_course, canvas_submission.user_id)
         return GradableSubmission(canvas_assignment, canvas_submission, student)
 
 
+_graders = {}
+_graders_lock = threading.Lock()
+
+
+def canvas_grader_for(platform):
+    """
+    Return the long-lived CanvasGrader of a Platform.
+
+    Clients are kept for the life of the process so connections and caches are
+    reused; one is rebuilt as soon as the platform's API URL or key changes.
+
+    Args:
+        platform: Platform row to connect to
+    """
+    fingerprint = (platform.api_url, platform.api_key)
+    with _graders_lock:
+        entry = _graders.get(platform.pk)
+        if entry is None or entry[0] != fingerprint:
+            entry = (fingerprint, CanvasGrader(platform.api_url, platform.api_key))
+            _graders[platform.pk] = entry
+        return entry[1]
+
+
 class GradableSubmission:
     def __init__(self, assignment, submission, student):
         self.assignment = assignment
@@ -101,7 +409,7 @@ class GradableSubmission:
         self.submission = submission
         self.student = student
         self.submission_body = clean_html_text(submission.body)
-        self.submission_time = submission.submitted_at
+        self.submission_time = getattr(submission, 'submitted_at_date', None) or parse_datetime(submission.submitted_at)
         self.assignment_description = clean_html_text(assignment.description)
         self.student_name = student.name
         self.student_id = student.login_id
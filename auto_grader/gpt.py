@@ -12,7 +12,8 @@ from selenium.webdriver.common.keys import Keys
 
 class ChatGPTAutomation:
 
-    def __init__(self, chrome_path, chrome_driver_path, cookie=None):
+    def __init__(self, chrome_path, chrome_driver_path, cookie=None, response_timeout=180, response_quiet_period=1.0,
+                 profile_dir='remote-profile', interactive=True):
         """
         This constructor automates the following steps:
         1. Open a Chrome browser with remote debugging enabled.
@@ -22,18 +23,27 @@ class ChatGPTAutomation:
         :param chrome_path: file path to chrome browser
         :param chrome_driver_path: file path to chromedriver executable
         :param cookie: optional session cookie for authentication
+        :param response_timeout: seconds to wait for a response to end
+        :param response_quiet_period: seconds the page must stay unchanged before a response counts as ended
+        :param profile_dir: Chrome user data directory; every concurrently running instance needs its own
+        :param interactive: ask on the console to complete the log-in; off when relaunching a logged-in profile
         """
 
         self.cookie = cookie
         self.chrome_path = chrome_path
         self.chrome_driver_path = chrome_driver_path
         self.chrome_process = None
+        self.response_timeout = response_timeout
+        self.profile_dir = profile_dir
+        self.response_quiet_period = response_quiet_period
+        self.messages_before_prompt = 0
+        self.input_selector = None
 
         url = r"https://chatgpt.com"
         self.free_port = self.find_available_port()
 
         self.launch_chrome_with_remote_debugging(self.free_port, url)
-        if cookie is None:
+        if cookie is None and interactive:
             self.wait_for_human_verification()
         self.driver = self.setup_webdriver(self.free_port)
         if cookie:
@@ -66,7 +76,7 @@ class ChatGPTAutomation:
         chrome_cmd = [
             self.chrome_path,
             f'--remote-debugging-port={port}',
-            '--user-data-dir=remote-profile',
+            f'--user-data-dir={self.profile_dir}',
             url
         ]
         
@@ -139,6 +149,34 @@ class ChatGPTAutomation:
         cookie = [elem for elem in cookies if elem["name"] == '__Secure-next-auth.session-token'][0]['value']
         return cookie
 
+    def find_input_box(self):
+        """ Returns the interactable ChatGPT input element. The selector that matched first is remembered for this
+            session and tried before any other, so later prompts find the input with a single lookup. """
+
+        input_selectors = [
+            '//textarea[@placeholder and not(@disabled)]',  # Active textarea
+            '//div[@contenteditable="true" and not(@aria-disabled="true")]',  # Active contenteditable
+            '//textarea[contains(@id, "prompt") and not(@disabled)]',
+            '//div[contains(@data-testid, "composer-text-input")]',
+            '//*[@role="textbox" and not(@disabled) and not(@aria-disabled="true")]',
+        ]
+        if self.input_selector:
+            input_selectors.remove(self.input_selector)
+            input_selectors.insert(0, self.input_selector)
+
+        for selector in input_selectors:
+            try:
+                for element in self.driver.find_elements(By.XPATH, selector):
+                    # Check if element is actually interactable
+                    if element.is_displayed() and element.is_enabled():
+                        if selector != self.input_selector:
+                            print(f"Found interactive input element with selector: {selector}")
+                            self.input_selector = selector
+                        return element
+            except Exception as e:
+                print(f"Element not interactable with selector {selector}: {e}")
+        return None
+
     def send_prompt_to_chatgpt(self, prompt):
         """ Sends a message to ChatGPT and waits for the response """
         
@@ -147,72 +185,32 @@ class ChatGPTAutomation:
         input_box = None
         
         for attempt in range(max_attempts):
-            print(f"Looking for input element (attempt {attempt + 1}/{max_attempts})")
-            
-            # Try multiple selectors to find the input element
-            input_selectors = [
-                '//textarea[@placeholder and not(@disabled)]',  # Active textarea
-                '//div[@contenteditable="true" and not(@aria-disabled="true")]',  # Active contenteditable
-                '//textarea[contains(@id, "prompt") and not(@disabled)]',
-                '//div[contains(@data-testid, "composer-text-input")]',
-                '//*[@role="textbox" and not(@disabled) and not(@aria-disabled="true")]',
-            ]
-            
-            for selector in input_selectors:
-                try:
-                    elements = self.driver.find_elements(By.XPATH, selector)
-                    for element in elements:
-                        # Check if element is actually interactable
-                        if element.is_displayed() and element.is_enabled():
-                            # Try to click and interact with it
-                            self.driver.execute_script("arguments[0].scrollIntoView(true);", element)
-                            time.sleep(0.5)
-                            element.click()
-                            time.sleep(0.5)
-                            
-                            # Test if we can type in it
-                            element.send_keys("test")
-                            time.sleep(0.2)
-                            element.clear()
-                            
-                            input_box = element
-                            print(f"Found interactive input element with selector: {selector}")
-                            break
-                except Exception as e:
-                    print(f"Element not interactable with selector {selector}: {e}")
-                    continue
-                    
-                if input_box:
-                    break
-            
+            input_box = self.find_input_box()
             if input_box:
                 break
-                
+            print(f"Looking for input element (attempt {attempt + 1}/{max_attempts})")
             time.sleep(2)
         
         if input_box is None:
             raise Exception("Could not find interactable ChatGPT input element after multiple attempts")
         
         # Send the prompt
+        self.messages_before_prompt = len(self.driver.find_elements(by=By.CSS_SELECTOR, value='div.text-message'))
         try:
             print("Sending prompt to ChatGPT...")
             
             # Ensure element is focused
+            self.driver.execute_script("arguments[0].scrollIntoView(true);", input_box)
             input_box.click()
-            time.sleep(0.5)
             
             # Clear any existing content thoroughly
             input_box.send_keys(Keys.CONTROL + "a")  # Select all
-            time.sleep(0.2)
             input_box.send_keys(Keys.DELETE)  # Delete selected content
-            time.sleep(0.5)
             
-            # Send the prompt
-            for line in prompt.splitlines():
-                input_box.send_keys(line)
-                input_box.send_keys(Keys.SHIFT + Keys.ENTER)
-                time.sleep(0.01)
-            time.sleep(1)
+            # Insert the whole prompt in one DevTools call instead of typing it, so the time does not grow with its
+            # length; the inserted newlines are line breaks and never trigger Enter-to-send
+            self.driver.execute_cdp_cmd('Input.insertText', {'text': prompt})
+            time.sleep(0.5)  # let the page enable the send button
             
             # Look for and click the send button instead of using keyboard shortcuts
             send_button = None
@@ -291,24 +289,55 @@ class ChatGPTAutomation:
         self.check_response_ended()
 
     def check_response_ended(self):
-        """ Checks if ChatGPT response ended """
+        """ Waits inside the page until the ChatGPT response ended.
+
+            A MutationObserver watches the conversation and resolves the async script once a new reply is on the
+            page, the stop button is gone and the DOM stayed quiet for response_quiet_period seconds, so this is a
+            single WebDriver call whose duration tracks the actual response time. Raises TimeoutError if the reply
+            did not finish within response_timeout seconds. """
         start_time = time.time()
-        time.sleep(10)  # wait for the response to start
-        found = 0
-        while found != 3:
-            print("Waiting for the response to end...")
-            time.sleep(0.5)
-            found = 0
-            if len(self.driver.find_elements(by=By.XPATH, value='//button[contains(@data-testid, "stop-button")]')) == 0:
-                found += 1
-            upper = self.driver.find_elements(by=By.CSS_SELECTOR, value='div.text-message')
-            if len(upper) > 0:
-                found += 1
-                inner = upper[-1].find_elements(by=By.TAG_NAME, value='p')
-                if len(inner) > 0:
-                    found += 1
-        print("Response ended.")
-        time.sleep(10)  # the length should be =4, so it's better to wait a moment to be sure it's really finished
+        print("Waiting for the response to end...")
+        self.driver.set_script_timeout(self.response_timeout + 5)
+        ended = self.driver.execute_async_script(
+            """
+            const [messagesBefore, quietMs, timeoutMs, done] = arguments;
+            let quietTimer = null;
+            let observer = null;
+
+            function replyFinished() {
+                if (document.querySelector('button[data-testid*="stop-button"]')) return false;
+                const messages = document.querySelectorAll('div.text-message');
+                // The prompt and the reply both add a message
+                if (messages.length < messagesBefore + 2) return false;
+                return messages[messages.length - 1].querySelector('p') !== null;
+            }
+
+            function finish(result) {
+                observer.disconnect();
+                clearTimeout(quietTimer);
+                clearTimeout(deadline);
+                done(result);
+            }
+
+            function check() {
+                clearTimeout(quietTimer);
+                if (replyFinished()) {
+                    quietTimer = setTimeout(() => replyFinished() && finish(true), quietMs);
+                }
+            }
+
+            const deadline = setTimeout(() => finish(false), timeoutMs);
+            observer = new MutationObserver(check);
+            observer.observe(document.body, {childList: true, subtree: true, characterData: true, attributes: true});
+            check();
+            """,
+            self.messages_before_prompt,
+            int(self.response_quiet_period * 1000),
+            int(self.response_timeout * 1000),
+        )
+        if not ended:
+            raise TimeoutError(f"ChatGPT response did not end within {self.response_timeout} seconds")
+        print(f"Response ended after {time.time() - start_time:.1f} seconds.")
 
     def return_chatgpt_conversation(self):
         """
@@ -341,10 +370,11 @@ class ChatGPTAutomation:
                     f"prompt: {chatgpt_conversation[i].text}\nresponse: {chatgpt_conversation[i + 1].text}\n\n{delimiter}\n\n")
 
     def return_last_response(self):
-        """ :return: the text of the last chatgpt response """
+        """ :return: the text of the last chatgpt response, one line per paragraph """
         time.sleep(0.5)
         response_elements = self.driver.find_elements(by=By.CSS_SELECTOR, value='div.text-message')
-        return response_elements[-1].find_element(by=By.TAG_NAME, value='p').text
+        paragraphs = response_elements[-1].find_elements(by=By.TAG_NAME, value='p')
+        return "\n".join(paragraph.text for paragraph in paragraphs)
 
     @staticmethod
     def wait_for_human_verification():
@@ -0,0 +1,155 @@
+import base64
+import hashlib
+import json
+import os
+import tempfile
+import time
+from pathlib import Path
+
+from requests import Response
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+# Headers that describe the transfer rather than the stored body
+_TRANSFER_HEADERS = {'content-encoding', 'content-length', 'transfer-encoding', 'connection'}
+
+
+class ConditionalCacheAdapter(HTTPAdapter):
+    """
+    HTTPAdapter that keeps the last 200 response of every GET URL on disk and
+    revalidates it with If-None-Match / If-Modified-Since.
+
+    When the server answers 304 Not Modified the stored body is replayed as a
+    regular 200 response, carrying the fresh headers of the 304 (rate limit
+    counters and the like). Entries are keyed by URL and Authorization header,
+    so different tokens never share cached data.
+
+    Stored bodies may hold student data, so the directory is bounded: expired
+    entries are deleted, and once it holds more than max_entries files the
+    least recently used ones go first.
+
+    Args:
+        cache_dir: Directory holding one JSON file per cached URL
+        max_age: Seconds after which a stored entry is no longer used for revalidation
+        max_entries: Maximum number of files kept in cache_dir
+    """
+
+    # Stores between two scans of the cache directory
+    PRUNE_EVERY = 50
+
+    def __init__(self, cache_dir, max_age, max_entries=10000, **kwargs):
+        super().__init__(**kwargs)
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_age = max_age
+        self.max_entries = max_entries
+        self.stores = 0
+        self.hits = 0
+        self.misses = 0
+        self.prune()
+
+    def entry_path(self, request):
+        key = f"{request.url}\n{request.headers.get('Authorization', '')}"
+        return self.cache_dir / f'{hashlib.sha256(key.encode()).hexdigest()}.json'
+
+    def load(self, path):
+        """Return the stored entry, or None if it is missing, unreadable or too old"""
+        try:
+            with open(path) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if time.time() - entry.get('stored_at', 0) > self.max_age:
+            self.remove(path)
+            return None
+        # Revalidated entries count as recently used for eviction
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return entry
+
+    def remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def prune(self):
+        """Delete expired entries, then the least recently used ones beyond max_entries"""
+        entries = []
+        for path in self.cache_dir.glob('*.json'):
+            try:
+                entries.append((path.stat().st_mtime, path))
+            except OSError:
+                continue
+        expired_before = time.time() - self.max_age
+        entries.sort()
+        excess = len(entries) - self.max_entries
+        for index, (mtime, path) in enumerate(entries):
+            if mtime < expired_before or index < excess:
+                self.remove(path)
+
+    def store(self, path, response):
+        """Write a 200 response to disk atomically"""
+        entry = {
+            'stored_at': time.time(),
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'headers': {k: v for k, v in response.headers.items() if k.lower() not in _TRANSFER_HEADERS},
+            'encoding': response.encoding,
+            'body': base64.b64encode(response.content).decode(),
+        }
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(entry, f)
+            os.replace(tmp_path, path)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        self.stores += 1
+        if self.stores % self.PRUNE_EVERY == 0:
+            self.prune()
+
+    def replay(self, request, not_modified, entry):
+        """Build a 200 response from a stored entry and the headers of a 304"""
+        response = Response()
+        response.status_code = 200
+        response.reason = 'OK'
+        response.headers = CaseInsensitiveDict(entry['headers'])
+        for name, value in not_modified.headers.items():
+            if name.lower() not in _TRANSFER_HEADERS:
+                response.headers[name] = value
+        response._content = base64.b64decode(entry['body'])
+        response.encoding = entry['encoding']
+        response.url = not_modified.url
+        response.request = request
+        response.connection = self
+        response.elapsed = not_modified.elapsed
+        response.from_cache = True
+        return response
+
+    def send(self, request, **kwargs):
+        if request.method != 'GET':
+            return super().send(request, **kwargs)
+
+        path = self.entry_path(request)
+        entry = self.load(path)
+        if entry:
+            if entry['etag']:
+                request.headers['If-None-Match'] = entry['etag']
+            if entry['last_modified']:
+                request.headers['If-Modified-Since'] = entry['last_modified']
+
+        response = super().send(request, **kwargs)
+        if response.status_code == 304 and entry:
+            self.hits += 1
+            response.close()
+            return self.replay(request, response, entry)
+
+        self.misses += 1
+        if response.status_code == 200 and ('ETag' in response.headers or 'Last-Modified' in response.headers):
+            self.store(path, response)
+        return response
@@ -0,0 +1,100 @@
+import os
+import socket
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from auto_grader.models import Submission
+
+def default_worker_id():
+    """Identify this process as hostname:pid"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def claimable(from_status, claim_status, now):
+    """Rows waiting in from_status, or held in claim_status by a worker whose lease has run out"""
+    return Q(status=from_status) | Q(status=claim_status, lease_expires_at__lt=now)
+
+
+def waiting_ids(from_status, claim_status, now=None):
+    """
+    IDs of the rows a worker could claim right now.
+
+    Left unordered so both branches of claimable() are answered from the
+    status index; callers sort the (small) result themselves.
+    """
+    return Submission.objects.filter(
+        claimable(from_status, claim_status, now or timezone.now())
+    ).order_by().values_list('id', flat=True)
+
+
+def claim_submissions(from_status, claim_status, worker_id, limit, ids=None):
+    """
+    Atomically take up to limit submissions for one worker.
+
+    Each candidate is flipped to claim_status by an UPDATE that re-checks
+    the status, so two workers racing for the same rows never both win them,
+    and only the rows this call's own UPDATEs won are returned; threads
+    sharing a worker_id never pick up each other's claims. Rows whose lease
+    expired (their worker died or stalled) are claimable again.
+
+    Args:
+        from_status: Status of the rows waiting for work
+        claim_status: In-progress status the claimed rows move to
+        worker_id: Identifier of the claiming worker
+        limit: Maximum number of rows to claim
+        ids: Optional submission IDs to restrict the claim to, in the order they should be returned
+
+    Returns:
+        list of the claimed Submission rows, with assignment, user and platform loaded
+    """
+    now = timezone.now()
+    lease_expires_at = now + timedelta(seconds=settings.GRADER_LEASE_SECONDS)
+
+    candidates = Submission.objects.filter(claimable(from_status, claim_status, now))
+    if ids is not None:
+        candidates = candidates.filter(id__in=ids)
+    candidates = list(candidates.order_by('id').values_list('id', flat=True)[:limit])
+
+    claimed = []
+    with transaction.atomic():
+        for submission_id in candidates:
+            if Submission.objects.filter(id=submission_id).filter(
+                claimable(from_status, claim_status, now)
+            ).update(status=claim_status, claimed_by=worker_id, lease_expires_at=lease_expires_at):
+                claimed.append(submission_id)
+    if not claimed:
+        return []
+    submissions = list(Submission.objects.filter(id__in=claimed).select_related(
+        'assignment', 'assignment__user', 'assignment__platform'
+    ).order_by('id'))
+    if ids is not None:
+        position = {submission_id: i for i, submission_id in enumerate(ids)}
+        submissions.sort(key=lambda s: position[s.id])
+    return submissions
+
+
+def release_submission(submission, worker_id, claim_status, status, **fields):
+    """
+    Hand a claimed submission back with its new status and fields.
+
+    Nothing is written if the lease was lost to another worker in the meantime.
+
+    Returns:
+        bool: True if this worker still held the submission
+    """
+    released = Submission.objects.filter(
+        id=submission.id, status=claim_status, claimed_by=worker_id
+    ).update(status=status, claimed_by=None, lease_expires_at=None, **fields)
+    if not released:
+        print(f"Lease on submission ID {submission.id} was lost, discarding the result")
+        return False
+    submission.status = status
+    submission.claimed_by = None
+    submission.lease_expires_at = None
+    for name, value in fields.items():
+        setattr(submission, name, value)
+    return True
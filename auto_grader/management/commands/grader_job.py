@@ -1,14 +1,23 @@
 import asyncio
+import queue
+import re
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import timedelta
 
 from django.conf import settings
 from django.core.management import BaseCommand
+from django.db import close_old_connections, transaction
+from django.utils import timezone
 from telegram import Bot, InlineKeyboardMarkup, InlineKeyboardButton
 
-from auto_grader.canvas import CanvasGrader
-from auto_grader.gpt import ChatGPTAutomation
-from auto_grader.models import User, Assignment, Submission, Platform, RubricGrade, SubmissionStatus
+from auto_grader.canvas import canvas_grader_for
+from auto_grader.backends import BackendUnavailable, get_grading_backend
+from auto_grader.leases import claim_submissions, default_worker_id, release_submission, waiting_ids
+from auto_grader.models import User, Assignment, Submission, Platform, RubricGrade, SubmissionStatus, SubmissionEvent
+from auto_grader.pipeline import WorkQueue
+from auto_grader.scheduler import FairGradingQueue, due_for_polling, retry_delay, schedule_next_polls
 from auto_grader.utils import send_grading_message_sync, RubricGradeButton
 
 grade_template = """Grade the following solution for the given problem using the rubric provided.
@@ -33,34 +42,129 @@ OUTPUT FORMAT (single line):
 Important: The GRADE must exactly match one of the grade numbers/identifiers from the rubric provided above.
 """
 
+batch_grade_template = """Grade each of the following solutions for the given problem using the rubric provided.
+
+Problem: {problem}
+
+Rubric: {rubric}
+
+Solutions:
+{solutions}
+Instructions:
+- Grade every solution on its own, without comparing it to the others
+- You must assign one of the EXACT grade options listed in the rubric above
+- Use only the grade identifiers/numbers specified in the rubric (e.g., if rubric shows "1: E - Excellent", use "1")
+- For higher grades: provide minimal or no feedback
+- For lower grades: provide brief technical feedback (1-2 sentences max) on how to improve
+- Use simple, formal language
+- Focus only on technical aspects
+
+OUTPUT FORMAT (plain text, no code block, one line per solution):
+<SUBMISSION_ID> | <GRADE_FROM_RUBRIC>: <FEEDBACK>
+
+Important: Include every submission ID listed above exactly once. The GRADE must exactly match one of the grade numbers/identifiers from the rubric provided above.
+"""
+
+batch_solution_template = """### Submission {submission_id}
+{solution}
+"""
+
+# One "<id> | <grade>: <feedback>" line of a batch reply
+BATCH_RESULT = re.compile(r'^\W*(\d+)\W*\|\s*([^:]+?)\s*:\s*(.*)$')
+
+
+class AssignmentContext:
+    """
+    Rubric data of an assignment that every submission of it needs,
+    loaded with a single query and shared for the rest of the cycle.
+    """
+
+    def __init__(self, assignment):
+        rubric_grades = list(RubricGrade.objects.filter(assignment=assignment).order_by('grade_number'))
+
+        # Build rubric text from structured rubric if available
+        self.rubric_text = assignment.rubric or ""
+        if rubric_grades:
+            self.rubric_text = "\n".join(f"{rg.grade_number}: {rg.short_description}" for rg in rubric_grades)
+
+        self.rubric_buttons = [
+            RubricGradeButton(
+                grade_number=rg.grade_number,
+                short_description=rg.short_description,
+            )
+            for rg in rubric_grades
+        ]
+
 
 class Command(BaseCommand):
     help = 'Run the grader job'
 
-    def process_submission(self, submission, gpt):
-        """Process a single submission"""
-        print("Processing submission for student: {} - assignment: {}".format(submission.student_name, submission.assignment_id))
-        try:
-            assignment = Assignment.objects.get(assignment_id=submission.assignment_id)
-            
+    def add_arguments(self, parser):
+        parser.add_argument('--ingest-workers', type=int, default=settings.GRADER_INGEST_WORKERS,
+                            help='Number of threads fetching courses from platforms (1 = sequential)')
+        parser.add_argument('--ingest-workers-per-platform', type=int,
+                            default=settings.GRADER_INGEST_WORKERS_PER_PLATFORM,
+                            help='Maximum concurrent fetches against a single platform')
+        parser.add_argument('--pipeline', action='store_true', default=settings.GRADER_PIPELINE,
+                            help='Run ingestion, grading and notification as concurrent stages')
+        parser.add_argument('--worker-id', type=str, default=settings.GRADER_WORKER_ID,
+                            help='Name this worker uses to claim submissions (defaults to hostname:pid)')
+
+    def ingest_submissions(self, submissions, assignments, advance_watermarks=True):
+        """
+        Store retrieved submissions in chunks of GRADER_INGEST_CHUNK_SIZE.
+
+        Once the stream is exhausted, the last chunk also advances last_retrieved
+        of every assignment past the newest submission seen, in the same
+        transaction. Canvas does not order the stream by time, so watermarks only
+        move after the whole stream was stored; if it fails midway they stay put
+        and the stored part is deduplicated on the next poll.
+
+        Args:
+            submissions: iterable of GradableSubmission
+            assignments: Assignment rows the submissions may belong to
+            advance_watermarks: False for partial retrievals such as single pushed events
+        """
+        assignments_by_id = {assignment.assignment_id: assignment for assignment in assignments}
+        latest = {}
+        chunk = []
+        for submission in submissions:
+            chunk.append(submission)
+            if len(chunk) >= settings.GRADER_INGEST_CHUNK_SIZE:
+                self.write_submission_chunk(chunk, assignments_by_id, latest)
+                chunk = []
+        self.write_submission_chunk(chunk, assignments_by_id, latest, advance_watermarks)
+
+    def write_submission_chunk(self, chunk, assignments_by_id, latest, advance_watermarks=False):
+        """
+        Insert a chunk of submissions with a single bulk_create.
+
+        Already stored submissions are skipped by the unique constraint on
+        (assignment, student_nid, submission_time) instead of a lookup per row.
+
+        Args:
+            chunk: list of GradableSubmission
+            assignments_by_id: Assignment rows keyed by platform assignment ID
+            latest: dict of Assignment to newest submission time seen so far, updated in place
+            advance_watermarks: Move last_retrieved past the times in latest
+        """
+        rows = []
+        described = {}
+        for submission in chunk:
+            assignment = assignments_by_id.get(submission.assignment_id)
+            if assignment is None:
+                print(f"Assignment {submission.assignment_id} not found in database")
+                continue
+
             # Update assignment description if not set
-            if not assignment.description:
+            if not assignment.description and submission.assignment_description:
                 assignment.description = submission.assignment_description
-                assignment.save()
-            
-            # Check if submission already exists
-            existing_submission = Submission.objects.filter(
-                assignment=assignment,
-                student_id=submission.student_id,
-                submission_time=submission.submission_time
-            ).first()
-            
-            if existing_submission:
-                print(f"Submission already exists with status: {existing_submission.status}")
-                return
-            
-            # Create new submission with 'new' status
-            s = Submission.objects.create(
+                described[assignment.pk] = assignment
+
+            if assignment not in latest or submission.submission_time > latest[assignment]:
+                latest[assignment] = submission.submission_time
+
+            rows.append(Submission(
                 assignment=assignment,
                 student_id=submission.student_id,
                 student_name=submission.student_name,
@@ -72,154 +176,714 @@ class Command(BaseCommand):
                 content=submission.submission_body,
                 feedback="",
                 status=SubmissionStatus.NEW
+            ))
+
+        with transaction.atomic():
+            Submission.objects.bulk_create(rows, ignore_conflicts=True)
+            if described:
+                Assignment.objects.bulk_update(described.values(), ['description'])
+            if advance_watermarks:
+                for assignment, submission_time in latest.items():
+                    last_retrieved = submission_time + timedelta(seconds=1)
+                    Assignment.objects.filter(
+                        pk=assignment.pk, last_retrieved__lt=last_retrieved
+                    ).update(last_retrieved=last_retrieved)
+                    assignment.last_retrieved = max(assignment.last_retrieved, last_retrieved)
+        if rows:
+            print(f"Wrote chunk of {len(rows)} submissions (already stored ones skipped)")
+
+    def assignment_context(self, assignment):
+        """Rubric context of an assignment, built at most once per cycle"""
+        context = self.assignment_contexts.get(assignment.pk)
+        if context is None:
+            context = self.assignment_contexts[assignment.pk] = AssignmentContext(assignment)
+        return context
+
+    def process_ungraded_submissions(self, backend):
+        """
+        Claim and grade new submissions in fair order, a batch at a time.
+
+        The fair order is computed once per cycle and claimed in successive
+        slices. Each slice holds at least as many submissions as the backend
+        can grade concurrently, and all of them are sent to it together. When
+        several submissions share a prompt, a slice is made of one group of
+        GRADING_BATCH_SIZE submissions of the same assignment per concurrent
+        prompt, so batch prompts are not split up by the fair interleaving.
+
+        A backend outage (BackendUnavailable) hands the claimed submissions
+        back untouched and ends the phase for this cycle.
+
+        Returns:
+            int: Number of submissions claimed for grading
+        """
+        print(f"Found {Submission.objects.filter(status=SubmissionStatus.NEW).count()} ungraded submissions to process")
+
+        if settings.GRADING_BATCH_SIZE > 1:
+            groups = self.grading_queue.batches(settings.GRADING_BATCH_SIZE)
+            slices = [
+                [submission_id for group in groups[start:start + backend.concurrency] for submission_id in group]
+                for start in range(0, len(groups), backend.concurrency)
+            ]
+        else:
+            ordered = self.grading_queue.order()
+            batch_size = max(settings.GRADER_CLAIM_BATCH_SIZE, backend.concurrency)
+            slices = [ordered[start:start + batch_size] for start in range(0, len(ordered), batch_size)]
+
+        graded = 0
+        self.backend_down = False
+        for ids in slices:
+            claimed = claim_submissions(
+                SubmissionStatus.NEW, SubmissionStatus.GRADING, self.worker_id, len(ids), ids=ids,
             )
-            print(f"Created new submission with ID: {s.id}")
-            
-        except Assignment.DoesNotExist:
-            print(f"Assignment {submission.assignment_id} not found in database")
+            self.grading_queue.charge(claimed)
+            if settings.GRADING_BATCH_SIZE > 1:
+                self.grade_in_batches(backend, claimed)
+            elif backend.concurrency > 1:
+                self.grade_submissions(backend, claimed)
+            else:
+                for s in claimed:
+                    if self.backend_down:
+                        self.release_for_outage(s, "Skipped while the grading backend is unavailable")
+                    else:
+                        self.grade_submission(backend, s)
+            if self.backend_down:
+                # The backlog is healthy; wait for the backend instead of burning retries
+                print("Grading backend unavailable, pausing grading until the next cycle")
+                break
+            graded += len(claimed)
+        self.grading_queue.report()
+        for line in backend.health():
+            print(f"Grading backend {line}")
+        return graded
+
+    def grading_prompt(self, s):
+        """Prompt asking the model to grade one submission"""
+        assignment = s.assignment
+        return grade_template.format(
+            problem=assignment.description,
+            solution=s.content,
+            rubric=self.assignment_context(assignment).rubric_text
+        )
+
+    def grade_submission(self, backend, s):
+        """
+        Grade a single submission claimed in GRADING status.
+
+        Returns:
+            bool: True if the submission was graded
+        """
+        try:
+            print(f"Grading submission ID: {s.id} for student: {s.student_name}")
+            response = backend.grade(self.grading_prompt(s))
+        except BackendUnavailable as e:
+            print(f"Grading backend unavailable for submission ID {s.id}: {e}")
+            self.release_for_outage(s, str(e))
+            return False
         except Exception as e:
-            print(f"Error processing submission: {e}")
+            print(f"Error grading submission ID {s.id}: {e}")
+            self.record_grading_failure(s, str(e))
+            return False
+        return self.store_grading_response(s, response)
 
-    def process_ungraded_submissions(self, gpt):
-        """Process all submissions that are new status"""
-        ungraded_submissions = Submission.objects.filter(status=SubmissionStatus.NEW)
-        print(f"Found {ungraded_submissions.count()} ungraded submissions to process")
-        
-        for s in ungraded_submissions:
-            try:
-                print(f"Grading submission ID: {s.id} for student: {s.student_name}")
-                assignment = s.assignment
-
-                # Build rubric text from structured rubric if available
-                rubric_text = assignment.rubric or ""
-                rubric_grades = RubricGrade.objects.filter(assignment=assignment).order_by('grade_number')
-                if rubric_grades.exists():
-                    rubric_parts = [f"{rg.grade_number}: {rg.short_description}" for rg in rubric_grades]
-                    rubric_text = "\n".join(rubric_parts)
-                
-                # Grade the submission
-                gpt.send_prompt_to_chatgpt(
-                    grade_template.format(
-                        problem=assignment.description,
-                        solution=s.content,
-                        rubric=rubric_text
-                    )
-                )
-                response = gpt.return_last_response()
-                gpt.open_chatgpt()
-                
-                # Parse response
-                if ":" in response:
-                    grade, feedback = response.split(":", 1)
-                    s.grade = grade.strip()
-                    s.feedback = feedback.strip()
-                    s.status = SubmissionStatus.GRADED
+    def grade_submissions(self, backend, submissions):
+        """Grade claimed submissions concurrently on the backend"""
+        print(f"Grading {len(submissions)} submissions with up to {backend.concurrency} in flight")
+        prompts = [self.grading_prompt(s) for s in submissions]
+        for s, response in zip(submissions, backend.grade_many(prompts)):
+            if isinstance(response, BackendUnavailable):
+                print(f"Grading backend unavailable for submission ID {s.id}: {response}")
+                self.release_for_outage(s, str(response))
+            elif isinstance(response, Exception):
+                print(f"Error grading submission ID {s.id}: {response}")
+                self.record_grading_failure(s, str(response))
+            else:
+                self.store_grading_response(s, response)
+
+    def grade_in_batches(self, backend, submissions):
+        """
+        Grade claimed submissions with one prompt per GRADING_BATCH_SIZE
+        submissions of the same assignment, so the problem and rubric are
+        sent once per batch instead of once per submission.
+
+        Submissions missing from a batch reply, or whose batch failed, are
+        graded again on their own.
+        """
+        by_assignment = {}
+        for s in submissions:
+            by_assignment.setdefault(s.assignment_id, []).append(s)
+
+        batches = []
+        singles = []
+        size = settings.GRADING_BATCH_SIZE
+        for group in by_assignment.values():
+            for start in range(0, len(group), size):
+                batch = group[start:start + size]
+                if len(batch) > 1:
+                    batches.append(batch)
                 else:
-                    s.status = SubmissionStatus.NEW  # Reset to 'new' for retry
-                
-                s.save()
-                print(f"Graded submission ID: {s.id} with grade: {s.grade}")
-                
-            except Exception as e:
-                print(f"Error grading submission ID {s.id}: {e}")
-                # In case of error, reset status to 'new' for retry
-                s.status = SubmissionStatus.NEW
-                s.save()
+                    singles.extend(batch)
+
+        if batches:
+            print(f"Grading {len(submissions) - len(singles)} submissions in {len(batches)} batch prompts")
+            prompts = [self.batch_grading_prompt(batch) for batch in batches]
+            for batch, response in zip(batches, backend.grade_many(prompts)):
+                if isinstance(response, BackendUnavailable):
+                    print(f"Grading backend unavailable for batch {[s.id for s in batch]}: {response}")
+                    for s in batch:
+                        self.release_for_outage(s, str(response))
+                    continue
+                if isinstance(response, Exception):
+                    print(f"Error grading batch {[s.id for s in batch]}: {response}")
+                    singles.extend(batch)
+                    continue
+                results = self.parse_batch_response(response, batch)
+                for s in batch:
+                    if s.id in results:
+                        self.store_grade(s, *results[s.id])
+                    else:
+                        singles.append(s)
+
+        if singles and self.backend_down:
+            for s in singles:
+                self.release_for_outage(s, "Skipped while the grading backend is unavailable")
+        elif singles:
+            print(f"Grading {len(singles)} submissions on their own")
+            if backend.concurrency > 1:
+                self.grade_submissions(backend, singles)
+            else:
+                for s in singles:
+                    self.grade_submission(backend, s)
+
+    def batch_grading_prompt(self, batch):
+        """Prompt asking the model to grade several submissions of one assignment"""
+        assignment = batch[0].assignment
+        return batch_grade_template.format(
+            problem=assignment.description,
+            rubric=self.assignment_context(assignment).rubric_text,
+            solutions="\n".join(
+                batch_solution_template.format(submission_id=s.id, solution=s.content) for s in batch
+            ),
+        )
+
+    @staticmethod
+    def parse_batch_response(response, batch):
+        """
+        Split a batch reply into per-submission results.
+
+        Returns:
+            dict of submission ID to (grade, feedback), for the IDs of the batch found in the reply
+        """
+        expected = {s.id for s in batch}
+        results = {}
+        for line in response.splitlines():
+            match = BATCH_RESULT.match(line.strip())
+            if match and int(match.group(1)) in expected:
+                results.setdefault(int(match.group(1)), (match.group(2), match.group(3)))
+        return results
+
+    def store_grading_response(self, s, response):
+        """
+        Parse a "<grade>: <feedback>" reply and store it on the submission.
+
+        Returns:
+            bool: True if the submission was graded
+        """
+        # Parse response
+        if ":" in response:
+            grade, feedback = response.split(":", 1)
+            return self.store_grade(s, grade, feedback)
+
+        self.record_grading_failure(s, f"Unparseable response: {response[:500]}")
+        return False
+
+    def store_grade(self, s, grade, feedback):
+        """
+        Store the grade of a claimed submission and hand it on for notification.
+
+        A success clears the retry state, so attempts only ever counts
+        consecutive failures and regenerated grades get a full retry budget.
+        """
+        graded = release_submission(
+            s, self.worker_id, SubmissionStatus.GRADING, SubmissionStatus.GRADED,
+            grade=grade.strip(), feedback=feedback.strip(),
+            attempts=0, next_attempt_at=None, last_error='',
+        )
+        if graded:
+            print(f"Graded submission ID: {s.id} with grade: {s.grade}")
+        return graded
+
+    def record_grading_failure(self, s, error):
+        """
+        Count a failed grading attempt.
+
+        The submission goes back to NEW after an exponential backoff, or to
+        FAILED once it used up GRADER_MAX_ATTEMPTS, so poison submissions stop
+        taking browser time from the rest of the backlog.
+        """
+        attempts = s.attempts + 1
+        if attempts >= settings.GRADER_MAX_ATTEMPTS:
+            print(f"Submission ID {s.id} failed {attempts} times, marking as failed")
+            release_submission(
+                s, self.worker_id, SubmissionStatus.GRADING, SubmissionStatus.FAILED,
+                attempts=attempts, next_attempt_at=None, last_error=error,
+            )
+            return
+        delay = retry_delay(attempts)
+        print(f"Retrying submission ID {s.id} in {delay} (attempt {attempts} of {settings.GRADER_MAX_ATTEMPTS})")
+        release_submission(
+            s, self.worker_id, SubmissionStatus.GRADING, SubmissionStatus.NEW,
+            attempts=attempts, next_attempt_at=timezone.now() + delay, last_error=error,
+        )
+
+    def release_for_outage(self, s, error):
+        """
+        Hand a claimed submission back to NEW without using up an attempt.
+
+        Backend outages are not the submission's fault, so they must not push
+        a healthy backlog to FAILED.
+        """
+        self.backend_down = True
+        release_submission(
+            s, self.worker_id, SubmissionStatus.GRADING, SubmissionStatus.NEW, last_error=error,
+        )
 
     def send_grading_notifications(self):
-        """Phase 3: Send notifications for graded submissions"""
-        graded_submissions = Submission.objects.filter(status=SubmissionStatus.GRADED)
-        print(f"Found {graded_submissions.count()} graded submissions to notify")
-        
-        for s in graded_submissions:
-            try:
-                assignment = s.assignment
-                print(f"Sending notification for submission ID: {s.id}")
+        """
+        Phase 3: Claim graded submissions and send their notifications.
+
+        Returns:
+            int: Number of notifications sent
+        """
+        print(f"Found {Submission.objects.filter(status=SubmissionStatus.GRADED).count()} graded submissions to notify")
+
+        waiting = sorted(waiting_ids(SubmissionStatus.GRADED, SubmissionStatus.NOTIFYING))
+        batch_size = settings.GRADER_CLAIM_BATCH_SIZE
+        sent = 0
+        for start in range(0, len(waiting), batch_size):
+            ids = waiting[start:start + batch_size]
+            for s in claim_submissions(
+                SubmissionStatus.GRADED, SubmissionStatus.NOTIFYING, self.worker_id, len(ids), ids=ids,
+            ):
+                if self.notify_submission(s):
+                    sent += 1
+        return sent
+
+    def notify_submission(self, s):
+        """
+        Send the Telegram verification message of a submission claimed in NOTIFYING status.
+
+        Returns:
+            bool: True if the message was sent
+        """
+        try:
+            assignment = s.assignment
+            print(f"Sending notification for submission ID: {s.id}")
+            
+            # Send notification if user exists
+            if assignment.user:
+                send_grading_message_sync(
+                    chat_id=assignment.user.user_id,
+                    student_name=s.student_name,
+                    student_id=s.student_id,
+                    course_id=assignment.course_id,
+                    assignment_id=assignment.assignment_id,
+                    student_nid=s.student_nid,
+                    similarity_score=s.similarity_score,
+                    grade=s.grade,
+                    feedback=s.feedback,
+                    submission_id=s.id,
+                    rubric_grades=self.assignment_context(assignment).rubric_buttons,
+                    canvas_url=assignment.platform.api_url
+                )
+                # Change status to 'verification_sent' after telegram message is sent
+                release_submission(s, self.worker_id, SubmissionStatus.NOTIFYING, SubmissionStatus.VERIFICATION_SENT)
+                print(f"Notification sent for submission ID: {s.id}")
+                return True
+            else:
+                print(f"No user found for assignment {assignment.assignment_id}, skipping notification")
+                release_submission(s, self.worker_id, SubmissionStatus.NOTIFYING, SubmissionStatus.GRADED)
                 
-                # Send notification if user exists
-                if assignment.user:
-                    # Get rubric grades for the assignment
-                    rubric_grades = [
-                        RubricGradeButton(
-                            grade_number=button.grade_number,
-                            short_description=button.short_description,
-                        )
-                        for button in RubricGrade.objects.filter(assignment=assignment).order_by('grade_number')
-                    ]
-                    
-                    send_grading_message_sync(
-                        chat_id=assignment.user.user_id,
-                        student_name=s.student_name,
-                        student_id=s.student_id,
+        except Exception as e:
+            print(f"Error sending notification for submission ID {s.id}: {e}")
+            # Put it back to 'graded' for retry in next cycle
+            release_submission(s, self.worker_id, SubmissionStatus.NOTIFYING, SubmissionStatus.GRADED)
+        return False
+
+    def process_submission_events(self, backend):
+        """
+        Ingest the single submissions named by pending Canvas events.
+
+        Returns:
+            bool: True if at least one event was handled
+        """
+        events = list(SubmissionEvent.objects.filter(
+            processed_at__isnull=True
+        ).select_related('assignment', 'assignment__platform').order_by('received_at'))
+        if not events:
+            return False
+
+        print(f"=== Processing {len(events)} submission events ===")
+        for event in events:
+            assignment = event.assignment
+            try:
+                if assignment.platform and assignment.platform.name == 'Canvas':
+                    canvas_grader = canvas_grader_for(assignment.platform)
+                    submission = canvas_grader.retrieve_submission(assignment, event.student_nid)
+                    if submission is not None:
+                        self.ingest_submissions([submission], [assignment], advance_watermarks=False)
+            except Exception as e:
+                # The reconciliation sweep will still pick this submission up
+                print(f"Error processing submission event {event.id}: {e}")
+            event.processed_at = timezone.now()
+            event.save(update_fields=['processed_at'])
+        return True
+
+    def post_approved_grades(self):
+        """
+        Phase 4: Post approved grades to Canvas in one bulk update per assignment.
+
+        A batch accepted by Canvas moves to POSTING along with the ID of the
+        Canvas Progress applying it, and only reaches GRADE_POSTED once that
+        progress completes. Updates still running after the short
+        CANVAS_PROGRESS_TIMEOUT wait are checked again next cycle instead of
+        being posted twice, which would duplicate the feedback comments.
+
+        Returns:
+            int: Number of grades posted
+        """
+        total_posted = self.check_grade_updates()
+
+        approved_submissions = Submission.objects.filter(
+            status=SubmissionStatus.APPROVED
+        ).select_related('assignment', 'assignment__platform')
+        print(f"Found {approved_submissions.count()} approved grades to post")
+
+        by_assignment = {}
+        for s in approved_submissions:
+            if s.assignment and s.assignment.platform and s.assignment.platform.name == 'Canvas':
+                by_assignment.setdefault(s.assignment, []).append(s)
+
+        batch_size = settings.CANVAS_GRADE_BATCH_SIZE
+        for assignment, submissions in by_assignment.items():
+            canvas_grader = canvas_grader_for(assignment.platform)
+            for start in range(0, len(submissions), batch_size):
+                batch = submissions[start:start + batch_size]
+                try:
+                    progress_id = canvas_grader.start_grade_update(
                         course_id=assignment.course_id,
                         assignment_id=assignment.assignment_id,
-                        student_nid=s.student_nid,
-                        similarity_score=s.similarity_score,
-                        grade=s.grade,
-                        feedback=s.feedback,
-                        submission_id=s.id,
-                        rubric_grades=rubric_grades,
-                        canvas_url=assignment.platform.api_url
+                        grades={s.student_nid: (s.grade, s.feedback) for s in batch},
                     )
-                    # Change status to 'verification_sent' after telegram message is sent
-                    s.status = SubmissionStatus.VERIFICATION_SENT
-                    s.save()
-                    print(f"Notification sent for submission ID: {s.id}")
-                else:
-                    print(f"No user found for assignment {assignment.assignment_id}, skipping notification")
-                    
+                except Exception as e:
+                    print(f"Error posting grades for assignment {assignment.assignment_id}: {e}")
+                    continue
+                # Accepted by Canvas: from here on the update is only ever polled, never re-posted
+                Submission.objects.filter(
+                    id__in=[s.id for s in batch], status=SubmissionStatus.APPROVED
+                ).update(status=SubmissionStatus.POSTING, grade_progress_id=progress_id)
+                try:
+                    total_posted += self.finish_grade_update(
+                        canvas_grader, progress_id, settings.CANVAS_PROGRESS_TIMEOUT,
+                        f"assignment {assignment.assignment_id}",
+                    )
+                except Exception as e:
+                    print(f"Error checking bulk grade update {progress_id}, checking again next cycle: {e}")
+        return total_posted
+
+    def check_grade_updates(self):
+        """
+        Poll the bulk grade updates left running by earlier cycles.
+
+        Returns:
+            int: Number of grades whose update completed
+        """
+        pending = list(Submission.objects.filter(
+            status=SubmissionStatus.POSTING, grade_progress_id__isnull=False
+        ).values_list('assignment__platform', 'grade_progress_id').distinct())
+        platforms = Platform.objects.in_bulk({platform_id for platform_id, _ in pending})
+        if pending:
+            print(f"Checking {len(pending)} running bulk grade updates")
+
+        completed = 0
+        for platform_id, progress_id in pending:
+            try:
+                completed += self.finish_grade_update(
+                    canvas_grader_for(platforms[platform_id]), progress_id, 0, f"progress {progress_id}"
+                )
             except Exception as e:
-                print(f"Error sending notification for submission ID {s.id}: {e}")
-                # Keep status as 'graded' for retry in next cycle
+                print(f"Error checking bulk grade update {progress_id}: {e}")
+        return completed
+
+    def finish_grade_update(self, canvas_grader, progress_id, timeout, label):
+        """
+        Wait for a bulk grade update and settle the POSTING submissions it carries.
+
+        Completed updates move them to GRADE_POSTED; running ones are left for
+        the next cycle. A failed update may still have applied some grades and
+        comments, so its submissions go to POST_FAILED for an admin to retry
+        rather than being re-posted automatically.
+
+        Returns:
+            int: Number of grades posted by the update
+        """
+        state = canvas_grader.grade_update_state(progress_id, timeout=timeout)
+        posting = Submission.objects.filter(status=SubmissionStatus.POSTING, grade_progress_id=progress_id)
+        if state == 'completed':
+            posted = posting.update(status=SubmissionStatus.GRADE_POSTED)
+            print(f"Posted {posted} grades for {label}")
+            return posted
+        if state == 'failed':
+            failed = posting.update(
+                status=SubmissionStatus.POST_FAILED, last_error=f"Canvas bulk grade update {progress_id} failed",
+            )
+            print(f"Marked {failed} grades for {label} as failed to post")
+        else:
+            print(f"Bulk grade update {progress_id} for {label} is still {state}, checking again next cycle")
+        return 0
 
-    def process_platform_submissions(self, platform, gpt):
-        """Process submissions for a specific platform"""
+    def process_platform_submissions(self, platform, backend, assignments):
+        """Process submissions of the given assignments for a specific platform"""
         print(f"Processing submissions for platform: {platform.name}")
         if platform.name == 'Canvas':
             try:
-                canvas_grader = CanvasGrader(platform.api_url, platform.api_key)
-                for submission in canvas_grader.retrieve_all_new_submissions():
-                    self.process_submission(submission, gpt)
+                canvas_grader = canvas_grader_for(platform)
+                courses = canvas_grader.group_assignments_by_course(assignments)
             except Exception as e:
                 print(f"Error processing Canvas platform: {e}")
+                return
+            for course_id, course_assignments in courses.items():
+                try:
+                    self.ingest_submissions(
+                        canvas_grader.retrieve_all_new_submissions_for_course(course_id, course_assignments),
+                        course_assignments,
+                    )
+                except Exception as e:
+                    print(f"Error processing course {course_id} on platform {platform.name}: {e}")
+            print(f"Canvas metadata cache: {canvas_grader.metadata.stats()}")
         # Add other platforms here as needed
 
-    def update_assignment_timestamps(self):
-        """Update last_retrieved timestamps for all assignments"""
-        for assignment in Assignment.objects.all():
-            submissions = Submission.objects.filter(assignment=assignment)
-            if submissions.exists():
-                latest_submission_time = max(sub.submission_time for sub in submissions)
-                if latest_submission_time > assignment.last_retrieved:
-                    assignment.last_retrieved = latest_submission_time + timedelta(seconds=1)
-                    assignment.save()
+    def fetch_course_submissions(self, canvas_grader, limit, course_id, assignments):
+        """
+        Fetch new submissions of one course on a worker thread.
+
+        If the course stream fails, each assignment is retried on its own so a
+        single broken assignment does not hide the others. No DB writes happen here.
+        """
+        with limit:
+            try:
+                return list(canvas_grader.retrieve_all_new_submissions_for_course(course_id, assignments))
+            except Exception as e:
+                print(f"Error retrieving course {course_id}, retrying per assignment: {e}")
+
+            submissions = []
+            for assignment in assignments:
+                try:
+                    submissions.extend(canvas_grader.retrieve_all_new_submissions_for_assignment(assignment))
+                except Exception as e:
+                    print(f"Error retrieving assignment {assignment.assignment_id}: {e}")
+            return submissions
+
+    def process_platforms_concurrently(self, platforms, backend, assignments):
+        """
+        Fetch courses of all platforms in parallel while writing submissions on this thread.
+
+        At most ingest_workers fetches run at once, and at most
+        ingest_workers_per_platform of them against the same platform.
+        """
+        with ThreadPoolExecutor(max_workers=self.ingest_workers) as executor:
+            futures = {}
+            for platform in platforms:
+                print(f"Processing submissions for platform: {platform.name}")
+                if platform.name != 'Canvas':
+                    continue
+                try:
+                    canvas_grader = canvas_grader_for(platform)
+                    limit = threading.BoundedSemaphore(self.ingest_workers_per_platform)
+                    courses = canvas_grader.group_assignments_by_course(assignments)
+                except Exception as e:
+                    print(f"Error processing Canvas platform: {e}")
+                    continue
+                for course_id, course_assignments in courses.items():
+                    future = executor.submit(
+                        self.fetch_course_submissions, canvas_grader, limit, course_id, course_assignments
+                    )
+                    futures[future] = (platform, course_id)
+
+            for future in as_completed(futures):
+                platform, course_id = futures[future]
+                try:
+                    self.ingest_submissions(future.result(), assignments)
+                except Exception as e:
+                    print(f"Error processing course {course_id} on platform {platform.name}: {e}")
+
+        for platform in platforms:
+            if platform.name == 'Canvas':
+                print(f"Canvas metadata cache for {platform.name}: {canvas_grader_for(platform).metadata.stats()}")
 
     def handle(self, *args, **options):
-        gpt = ChatGPTAutomation(settings.CHROME_PATH, settings.CHROME_DRIVER_PATH)
-        gpt.open_chatgpt()
+        self.ingest_workers = max(1, options['ingest_workers'])
+        self.ingest_workers_per_platform = max(1, options['ingest_workers_per_platform'])
+        self.worker_id = options['worker_id'] or default_worker_id()
+        self.assignment_contexts = {}
+        self.backend_down = False
+        self.grading_queue = FairGradingQueue()
+        print(f"Starting grader worker {self.worker_id}")
+
+        backend = get_grading_backend()
+        backend.start()
+        print(f"Grading with the {backend.name} backend")
+
+        if options['pipeline']:
+            self.run_pipeline(backend)
+            return
         
         while True:
             try:
-                # Phase 1: Retrieve new submissions from platforms
-                print("=== Phase 1: Retrieving new submissions ===")
-                platforms = Platform.objects.all()
+                # Grade every tick: regenerated, requeued, retried and approved rows
+                # don't wait for the next ingested submission
+                worked = self.ingest_cycle(backend)
+                if not self.run_grading_phases(backend) and not worked:
+                    time.sleep(settings.GRADER_EVENT_POLL_INTERVAL)
+
+            except Exception as e:
+                print(f"Error in grader job main loop: {e}")
+                time.sleep(settings.GRADER_EVENT_POLL_INTERVAL)
+
+    def ingest_cycle(self, backend):
+        """
+        Handle pending submission events and poll the assignments that are due.
+
+        Returns:
+            bool: True if anything was ingested or polled
+        """
+        worked = self.process_submission_events(backend)
+
+        assignments = list(due_for_polling())
+        if assignments:
+            # Phase 1: Retrieve new submissions of assignments due for polling
+            print(f"=== Phase 1: Retrieving new submissions for {len(assignments)} assignments ===")
+            platforms = Platform.objects.all()
+            if self.ingest_workers > 1:
+                self.process_platforms_concurrently(platforms, backend, assignments)
+            else:
                 for platform in platforms:
-                    self.process_platform_submissions(platform, gpt)
-                # Update timestamps
-                self.update_assignment_timestamps()
+                    self.process_platform_submissions(platform, backend, assignments)
+            self.schedule_polls(platforms, assignments)
+            worked = True
+        return worked
 
-                # Phase 2: Process all ungraded submissions
-                print("=== Phase 2: Processing ungraded submissions ===")
-                self.process_ungraded_submissions(gpt)
-                
-                # Phase 3: Send grading notifications
-                print("=== Phase 3: Sending grading notifications ===")
-                self.send_grading_notifications()
-                
+    def run_pipeline(self, backend):
+        """
+        Run ingestion, grading and notification as concurrent stages.
+
+        This thread ingests and feeds waiting submissions into a bounded grade
+        queue; one grading thread per concurrent backend slot hands every graded
+        submission straight to a notification thread. Full queues block the
+        stage feeding them, so ingestion never runs far ahead of grading.
+        """
+        if settings.GRADING_BATCH_SIZE > 1:
+            print("The pipeline grades one submission per prompt; GRADING_BATCH_SIZE is ignored")
+        grade_queue = WorkQueue(settings.GRADER_PIPELINE_GRADE_QUEUE_SIZE)
+        notify_queue = WorkQueue(settings.GRADER_PIPELINE_NOTIFY_QUEUE_SIZE)
+        # One grading thread per prompt the backend can work on at once
+        for _ in range(backend.concurrency):
+            threading.Thread(target=self.grading_stage, args=(backend, grade_queue, notify_queue), daemon=True).start()
+        threading.Thread(target=self.notification_stage, args=(notify_queue,), daemon=True).start()
+
+        while True:
+            try:
+                worked = self.ingest_cycle(backend)
+                self.assignment_contexts = {}
+                # Pick up work left by earlier cycles or other stages
+                self.feed_stage(notify_queue, sorted(waiting_ids(SubmissionStatus.GRADED, SubmissionStatus.NOTIFYING)))
+                self.feed_stage(grade_queue, self.grading_queue.order())
+                self.grading_queue.report()
+                self.post_approved_grades()
+                print(f"Pipeline queues: grade={len(grade_queue)} notify={len(notify_queue)}")
+                if not worked:
+                    time.sleep(settings.GRADER_EVENT_POLL_INTERVAL)
 
             except Exception as e:
-                print(f"Error in grader job main loop: {e}")
-            
-            time.sleep(3600)
+                print(f"Error in grader job pipeline: {e}")
+                time.sleep(settings.GRADER_EVENT_POLL_INTERVAL)
+
+    def feed_stage(self, work_queue, submission_ids):
+        """Queue waiting submissions in the given order, blocking while the queue is full"""
+        try:
+            for submission_id in submission_ids:
+                work_queue.put(submission_id, timeout=settings.GRADER_EVENT_POLL_INTERVAL)
+        except queue.Full:
+            # The stage is saturated; the rest is offered again next cycle
+            pass
+
+    def grading_stage(self, backend, grade_queue, notify_queue):
+        """Pipeline stage grading queued submissions and passing them on for notification"""
+        while True:
+            submission_id = grade_queue.get()
+            try:
+                claimed = claim_submissions(
+                    SubmissionStatus.NEW, SubmissionStatus.GRADING, self.worker_id, 1, ids=[submission_id]
+                )
+                self.grading_queue.charge(claimed)
+                for s in claimed:
+                    if self.grade_submission(backend, s):
+                        notify_queue.put(s.id)
+            except Exception as e:
+                print(f"Error in grading stage for submission ID {submission_id}: {e}")
+            finally:
+                grade_queue.done(submission_id)
+                close_old_connections()
+            if self.backend_down:
+                # Give the backend time to recover instead of releasing the whole queue at once
+                time.sleep(settings.GRADER_EVENT_POLL_INTERVAL)
+                self.backend_down = False
+
+    def notification_stage(self, notify_queue):
+        """Pipeline stage sending Telegram messages as soon as submissions are graded"""
+        while True:
+            submission_id = notify_queue.get()
+            try:
+                for s in claim_submissions(
+                    SubmissionStatus.GRADED, SubmissionStatus.NOTIFYING, self.worker_id, 1, ids=[submission_id]
+                ):
+                    self.notify_submission(s)
+            except Exception as e:
+                print(f"Error in notification stage for submission ID {submission_id}: {e}")
+            finally:
+                notify_queue.done(submission_id)
+                close_old_connections()
+
+    def schedule_polls(self, platforms, assignments):
+        """Refresh due dates and pick the next poll time of each polled assignment"""
+        due_dates = {}
+        for platform in platforms:
+            if platform.name != 'Canvas':
+                continue
+            try:
+                due_dates.update(canvas_grader_for(platform).get_due_dates(assignments))
+            except Exception as e:
+                print(f"Error retrieving due dates from {platform.name}: {e}")
+        schedule_next_polls(assignments, due_dates)
+
+    def run_grading_phases(self, backend):
+        """
+        Phases 2-4: grade, notify and post whatever is waiting.
+
+        Returns:
+            bool: True if any submission was graded, notified or posted
+        """
+        # Rubrics edited in the admin are picked up from the next cycle on
+        self.assignment_contexts = {}
+
+        # Phase 2: Process all ungraded submissions
+        print("=== Phase 2: Processing ungraded submissions ===")
+        graded = self.process_ungraded_submissions(backend)
 
+        # Phase 3: Send grading notifications
+        print("=== Phase 3: Sending grading notifications ===")
+        notified = self.send_grading_notifications()
 
+        # Phase 4: Post grades approved in Telegram
+        print("=== Phase 4: Posting approved grades ===")
+        posted = self.post_approved_grades()
+        return bool(graded or notified or posted)
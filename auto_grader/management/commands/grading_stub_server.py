@@ -0,0 +1,78 @@
+import json
+import re
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.core.management.base import BaseCommand
+
+# First "<grade>: ..." line after the "Rubric:" header of a grading prompt
+RUBRIC_GRADE = re.compile(r'Rubric:\s*(\S+?):', re.MULTILINE)
+# Solution headers of a batch grading prompt
+BATCH_SUBMISSION = re.compile(r'^### Submission (\d+)$', re.MULTILINE)
+
+
+class Command(BaseCommand):
+    help = 'Serve a fake OpenAI-compatible chat completions endpoint for testing and benchmarking the API grading backend'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', type=str, default='127.0.0.1', help='Address to listen on')
+        parser.add_argument('--port', type=int, default=8090, help='Port to listen on')
+        parser.add_argument('--latency', type=float, default=1.0, help='Seconds to wait before each reply')
+        parser.add_argument('--grade', type=str, default='',
+                            help='Grade to reply with (defaults to the first grade of the prompt rubric)')
+
+    def handle(self, *args, **options):
+        command = self
+        latency = options['latency']
+        fixed_grade = options['grade']
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                if not self.path.rstrip('/').endswith('/chat/completions'):
+                    self.send_error(404)
+                    return
+                try:
+                    body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+                    prompt = body['messages'][-1]['content']
+                except (ValueError, KeyError, IndexError, TypeError):
+                    self.send_error(400, 'Malformed request')
+                    return
+
+                time.sleep(latency)
+                match = RUBRIC_GRADE.search(prompt)
+                grade = fixed_grade or (match.group(1) if match else '1')
+                submission_ids = BATCH_SUBMISSION.findall(prompt)
+                if submission_ids:
+                    content = '\n'.join(f'{submission_id} | {grade}: Stub feedback.' for submission_id in submission_ids)
+                else:
+                    content = f'{grade}: Stub feedback.'
+                payload = json.dumps({
+                    'object': 'chat.completion',
+                    'model': body.get('model', 'stub'),
+                    'choices': [{
+                        'index': 0,
+                        'message': {'role': 'assistant', 'content': content},
+                        'finish_reason': 'stop',
+                    }],
+                }).encode()
+
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                command.stdout.write(f"{self.address_string()} {format % args}")
+
+        server = ThreadingHTTPServer((options['host'], options['port']), Handler)
+        self.stdout.write(self.style.SUCCESS(
+            f"Stub grading API on http://{options['host']}:{options['port']}/v1 "
+            f"(set GRADING_BACKEND=api and GRADING_API_URL to this address)"
+        ))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -0,0 +1,55 @@
+import json
+import time
+import urllib.error
+import urllib.request
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = 'Replay Canvas live events from a file against the submission event endpoint'
+
+    def add_arguments(self, parser):
+        parser.add_argument('events_file', type=str, help='JSON array or JSON-lines file of Canvas live events')
+        parser.add_argument('--url', type=str, default='http://127.0.0.1:8000/api/canvas/events/', help='Event endpoint URL')
+        parser.add_argument('--token', type=str, default=settings.CANVAS_EVENTS_TOKEN, help='Bearer token (defaults to CANVAS_EVENTS_TOKEN)')
+        parser.add_argument('--delay', type=float, default=0.0, help='Seconds to wait between events')
+
+    def load_events(self, path):
+        with open(path) as f:
+            text = f.read().strip()
+        if text.startswith('['):
+            return json.loads(text)
+        return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+    def handle(self, *args, **options):
+        events = self.load_events(options['events_file'])
+        self.stdout.write(f"Replaying {len(events)} events to {options['url']}")
+
+        for i, event in enumerate(events, start=1):
+            request = urllib.request.Request(
+                options['url'],
+                data=json.dumps(event).encode(),
+                headers={
+                    'Content-Type': 'application/json',
+                    'Authorization': f"Bearer {options['token']}",
+                },
+                method='POST',
+            )
+            try:
+                with urllib.request.urlopen(request) as response:
+                    self.stdout.write(
+                        self.style.SUCCESS(f"[{i}] {response.status} {response.read().decode()}")
+                    )
+            except urllib.error.HTTPError as e:
+                self.stdout.write(
+                    self.style.ERROR(f"[{i}] {e.code} {e.read().decode()}")
+                )
+            except urllib.error.URLError as e:
+                self.stdout.write(
+                    self.style.ERROR(f"[{i}] Failed to reach endpoint: {e.reason}")
+                )
+                return
+            if options['delay']:
+                time.sleep(options['delay'])
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.1 on 2026-10-17 06:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auto_grader', '0010_submission_status_alter_submission_feedback'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='submission',
+            name='status',
+            field=models.CharField(choices=[('new', 'New'), ('graded', 'Graded'), ('verification_sent', 'Verification Sent'), ('approved', 'Approved'), ('grade_posted', 'Grade Posted')], default='new', max_length=20),
+        ),
+    ]
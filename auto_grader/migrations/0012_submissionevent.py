@@ -0,0 +1,25 @@
+# Generated by Django 5.1.1 on 2026-10-17 06:54
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auto_grader', '0011_alter_submission_status'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SubmissionEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('student_nid', models.IntegerField()),
+                ('event_name', models.CharField(max_length=100)),
+                ('received_at', models.DateTimeField(auto_now_add=True)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+                ('assignment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='submission_events', to='auto_grader.assignment')),
+            ],
+        ),
+    ]
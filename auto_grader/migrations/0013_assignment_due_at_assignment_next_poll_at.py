@@ -0,0 +1,23 @@
+# Generated by Django 5.1.1 on 2026-10-17 06:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auto_grader', '0012_submissionevent'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='assignment',
+            name='due_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='assignment',
+            name='next_poll_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
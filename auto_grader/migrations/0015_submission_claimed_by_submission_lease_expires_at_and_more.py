@@ -0,0 +1,28 @@
+# Generated by Django 5.1.1 on 2026-10-17 07:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auto_grader', '0014_submission_unique_submission_attempt'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='submission',
+            name='claimed_by',
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+        migrations.AddField(
+            model_name='submission',
+            name='lease_expires_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='submission',
+            name='status',
+            field=models.CharField(choices=[('new', 'New'), ('grading', 'Grading'), ('graded', 'Graded'), ('notifying', 'Notifying'), ('verification_sent', 'Verification Sent'), ('approved', 'Approved'), ('grade_posted', 'Grade Posted')], default='new', max_length=20),
+        ),
+    ]
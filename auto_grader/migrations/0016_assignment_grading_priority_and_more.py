@@ -0,0 +1,23 @@
+# Generated by Django 5.1.1 on 2026-10-17 07:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auto_grader', '0015_submission_claimed_by_submission_lease_expires_at_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='assignment',
+            name='grading_priority',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='assignment',
+            name='grading_weight',
+            field=models.PositiveIntegerField(default=1),
+        ),
+    ]
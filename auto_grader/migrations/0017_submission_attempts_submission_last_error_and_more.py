@@ -0,0 +1,33 @@
+# Generated by Django 5.1.1 on 2026-10-17 07:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auto_grader', '0016_assignment_grading_priority_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='submission',
+            name='attempts',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='submission',
+            name='last_error',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='submission',
+            name='next_attempt_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='submission',
+            name='status',
+            field=models.CharField(choices=[('new', 'New'), ('grading', 'Grading'), ('graded', 'Graded'), ('notifying', 'Notifying'), ('verification_sent', 'Verification Sent'), ('approved', 'Approved'), ('grade_posted', 'Grade Posted'), ('failed', 'Failed')], default='new', max_length=20),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.1.1 on 2026-10-17 07:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auto_grader', '0017_submission_attempts_submission_last_error_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='submission',
+            index=models.Index(fields=['status', 'lease_expires_at'], name='submission_status_lease_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='submission',
+            index=models.Index(fields=['assignment', 'status'], name='submission_assignment_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='submissionevent',
+            index=models.Index(fields=['processed_at', 'received_at'], name='submissionevent_pending_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.1 on 2026-10-17 07:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auto_grader', '0018_submission_submission_status_lease_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='submission',
+            name='grade_progress_id',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='submission',
+            name='status',
+            field=models.CharField(choices=[('new', 'New'), ('grading', 'Grading'), ('graded', 'Graded'), ('notifying', 'Notifying'), ('verification_sent', 'Verification Sent'), ('approved', 'Approved'), ('posting', 'Posting'), ('grade_posted', 'Grade Posted'), ('failed', 'Failed')], default='new', max_length=20),
+        ),
+    ]
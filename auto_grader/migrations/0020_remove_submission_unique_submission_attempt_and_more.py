@@ -0,0 +1,37 @@
+# Generated by Django 5.1.1 on 2026-10-17 07:31
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def remove_duplicate_submissions(apps, schema_editor):
+    """Keep the oldest row of every (assignment, student_nid, submission_time) group"""
+    Submission = apps.get_model('auto_grader', 'Submission')
+    duplicates = Submission.objects.filter(student_nid__isnull=False).values(
+        'assignment', 'student_nid', 'submission_time'
+    ).annotate(first_id=Min('id'), count=Count('id')).filter(count__gt=1)
+    for duplicate in duplicates:
+        Submission.objects.filter(
+            assignment=duplicate['assignment'],
+            student_nid=duplicate['student_nid'],
+            submission_time=duplicate['submission_time'],
+        ).exclude(id=duplicate['first_id']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auto_grader', '0019_submission_grade_progress_id_alter_submission_status'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='submission',
+            name='unique_submission_attempt',
+        ),
+        migrations.RunPython(remove_duplicate_submissions, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='submission',
+            constraint=models.UniqueConstraint(fields=('assignment', 'student_nid', 'submission_time'), name='unique_submission_attempt'),
+        ),
+    ]
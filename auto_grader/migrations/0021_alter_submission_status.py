@@ -0,0 +1,18 @@
+# Generated by Django 5.1.1 on 2026-10-17 07:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auto_grader', '0020_remove_submission_unique_submission_attempt_and_more'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='submission',
+            name='status',
+            field=models.CharField(choices=[('new', 'New'), ('grading', 'Grading'), ('graded', 'Graded'), ('notifying', 'Notifying'), ('verification_sent', 'Verification Sent'), ('approved', 'Approved'), ('posting', 'Posting'), ('post_failed', 'Post Failed'), ('grade_posted', 'Grade Posted'), ('failed', 'Failed')], default='new', max_length=20),
+        ),
+    ]
@@ -9,9 +9,15 @@ from enum import Enum
 
 class SubmissionStatus(models.TextChoices):
     NEW = 'new', 'New'
+    GRADING = 'grading', 'Grading'
     GRADED = 'graded', 'Graded'
+    NOTIFYING = 'notifying', 'Notifying'
     VERIFICATION_SENT = 'verification_sent', 'Verification Sent'
+    APPROVED = 'approved', 'Approved'
+    POSTING = 'posting', 'Posting'
+    POST_FAILED = 'post_failed', 'Post Failed'
     GRADE_POSTED = 'grade_posted', 'Grade Posted'
+    FAILED = 'failed', 'Failed'
 
 class User(models.Model):
     user_id = models.IntegerField()
@@ -39,6 +45,10 @@ class Assignment(models.Model):
     last_retrieved = models.DateTimeField(default=datetime(2000, 1, 1))
     description = models.TextField(null=True, blank=True)
     rubric = models.TextField(null=True, blank=True)
+    due_at = models.DateTimeField(null=True, blank=True)
+    next_poll_at = models.DateTimeField(null=True, blank=True)
+    grading_priority = models.IntegerField(default=0)  # higher is graded first within the instructor's queue
+    grading_weight = models.PositiveIntegerField(default=1)  # share of grading time relative to other instructors
 
     def __str__(self):
         return str(self.assignment_id)
@@ -70,6 +80,44 @@ class Submission(models.Model):
     content = models.TextField()
     feedback = models.TextField(blank=True, default='')
     status = models.CharField(max_length=20, choices=SubmissionStatus.choices, default=SubmissionStatus.NEW)
+    claimed_by = models.CharField(max_length=255, null=True, blank=True)
+    lease_expires_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True, default='')
+    # Canvas Progress of the bulk update a POSTING grade was sent in
+    grade_progress_id = models.BigIntegerField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                # student_nid is the Canvas user ID, always set; student_id (login) may be missing
+                fields=['assignment', 'student_nid', 'submission_time'],
+                name='unique_submission_attempt',
+            ),
+        ]
+        indexes = [
+            # Work queues: claims filter on status, and on the lease of in-progress rows
+            models.Index(fields=['status', 'lease_expires_at'], name='submission_status_lease_idx'),
+            # Per-assignment status counts in the admin
+            models.Index(fields=['assignment', 'status'], name='submission_assignment_idx'),
+        ]
 
     def __str__(self):
         return self.assignment.__str__() + " " + self.student_name
+
+class SubmissionEvent(models.Model):
+    """A Canvas "submission created/updated" event waiting to be ingested by grader_job"""
+    assignment = models.ForeignKey(Assignment, on_delete=models.CASCADE, related_name='submission_events')
+    student_nid = models.IntegerField()
+    event_name = models.CharField(max_length=100)
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['processed_at', 'received_at'], name='submissionevent_pending_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.event_name} {self.assignment} {self.student_nid}"
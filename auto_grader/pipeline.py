@@ -0,0 +1,57 @@
+import queue
+import threading
+
+
+class WorkQueue:
+    """
+    Bounded queue of submission IDs connecting two grader_job stages.
+
+    put() blocks while the queue is full, so a slow stage holds back the stage
+    feeding it instead of letting work pile up in memory. An ID is only held
+    once until the consuming stage calls done() for it, which lets the feeder
+    re-offer everything still waiting in the database on every cycle.
+
+    Args:
+        maxsize: Maximum number of IDs waiting in the queue
+    """
+
+    def __init__(self, maxsize):
+        self.queue = queue.Queue(maxsize)
+        self._pending = set()
+        self._lock = threading.Lock()
+
+    def put(self, item_id, timeout=None):
+        """
+        Offer an ID to the next stage, waiting up to timeout seconds for room.
+
+        Returns:
+            bool: False if the ID is already queued
+
+        Raises:
+            queue.Full: If there was no room within timeout seconds
+        """
+        with self._lock:
+            if item_id in self._pending:
+                return False
+            self._pending.add(item_id)
+        try:
+            self.queue.put(item_id, timeout=timeout)
+        except queue.Full:
+            self.done(item_id)
+            raise
+        return True
+
+    def get(self, timeout=None):
+        """Next ID, or None if nothing arrived within timeout seconds"""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def done(self, item_id):
+        """Mark an ID as handled so it can be queued again"""
+        with self._lock:
+            self._pending.discard(item_id)
+
+    def __len__(self):
+        return self.queue.qsize()
@@ -0,0 +1,151 @@
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from enum import IntEnum
+
+from canvasapi.exceptions import RateLimitExceeded
+from django.conf import settings
+
+
+class CanvasPriority(IntEnum):
+    """Who is waiting on a Canvas call; lower values are served first"""
+    GRADE_POST = 0
+    ADMIN = 1
+    BULK_SYNC = 2
+
+
+_current_priority = contextvars.ContextVar('canvas_priority', default=CanvasPriority.BULK_SYNC)
+
+
+@contextmanager
+def canvas_priority(priority):
+    """Run the enclosed Canvas calls at the given priority (background sync by default)"""
+    token = _current_priority.set(priority)
+    try:
+        yield
+    finally:
+        _current_priority.reset(token)
+
+
+class RateLimitGovernor:
+    """
+    Shared throttle for one Canvas access token, driven by Canvas's rate limit headers.
+
+    Canvas meters every token with a leaky bucket and reports what is left in
+    X-Rate-Limit-Remaining. The governor keeps a delay between requests that
+    doubles when the bucket runs low or Canvas answers 403, and shrinks by a
+    fixed step while there is headroom (AIMD). A caller also waits while a
+    higher-priority caller is queued, or while the estimated quota is below
+    the reserve kept for higher priorities.
+    """
+
+    def __init__(self):
+        self.remaining = None
+        self.remaining_at = 0.0
+        self.request_cost = 0.0
+        self.delay = 0.0
+        self.next_slot = 0.0
+        self.waiting = {priority: 0 for priority in CanvasPriority}
+        self.condition = threading.Condition()
+
+    def reserve(self, priority):
+        """Quota that must stay untouched for callers above this priority"""
+        return {
+            CanvasPriority.GRADE_POST: 0,
+            CanvasPriority.ADMIN: settings.CANVAS_RATE_LIMIT_ADMIN_RESERVE,
+            CanvasPriority.BULK_SYNC: settings.CANVAS_RATE_LIMIT_SYNC_RESERVE,
+        }[priority]
+
+    def estimated_remaining(self, now):
+        """Last reported quota plus what the bucket has leaked since then"""
+        if self.remaining is None:
+            return None
+        return self.remaining + (now - self.remaining_at) * settings.CANVAS_RATE_LIMIT_REFILL
+
+    def acquire(self, priority):
+        """Block until a request at this priority may be sent"""
+        with self.condition:
+            self.waiting[priority] += 1
+            try:
+                while True:
+                    now = time.monotonic()
+                    wait = self.next_slot - now
+                    if any(self.waiting[p] for p in CanvasPriority if p < priority):
+                        wait = max(wait, 0.1)
+                    remaining = self.estimated_remaining(now)
+                    reserve = self.reserve(priority)
+                    if remaining is not None and remaining < reserve:
+                        wait = max(wait, (reserve - remaining) / settings.CANVAS_RATE_LIMIT_REFILL)
+                    if wait <= 0:
+                        self.next_slot = now + self.delay
+                        return
+                    self.condition.wait(wait)
+            finally:
+                self.waiting[priority] -= 1
+                self.condition.notify_all()
+
+    def record(self, response):
+        """Update quota and delay from a Canvas response"""
+        throttled = response.status_code == 403 and b'Rate Limit Exceeded' in response.content
+        remaining = response.headers.get('X-Rate-Limit-Remaining')
+        cost = response.headers.get('X-Request-Cost')
+        with self.condition:
+            now = time.monotonic()
+            if remaining is not None:
+                self.remaining = float(remaining)
+                self.remaining_at = now
+            if cost is not None:
+                self.request_cost = float(cost)
+
+            if throttled:
+                self.remaining = 0.0
+                self.remaining_at = now
+                self.delay = min(settings.CANVAS_RATE_LIMIT_MAX_DELAY, max(1.0, self.delay * 2))
+                self.next_slot = max(self.next_slot, now + self.delay)
+            elif self.remaining is not None and self.remaining < settings.CANVAS_RATE_LIMIT_LOW_WATER:
+                self.delay = min(settings.CANVAS_RATE_LIMIT_MAX_DELAY, max(0.1, self.delay * 2))
+            else:
+                self.delay = max(0.0, self.delay - 0.05)
+            self.condition.notify_all()
+
+
+_governors = {}
+_governors_lock = threading.Lock()
+
+
+def governor_for(api_url, api_key):
+    """Return the process-wide governor for a Canvas token"""
+    with _governors_lock:
+        key = (api_url, api_key)
+        if key not in _governors:
+            _governors[key] = RateLimitGovernor()
+        return _governors[key]
+
+
+def install_governor(requester, governor):
+    """
+    Route every request of a canvasapi Requester through the governor.
+
+    Throttled requests are retried up to CANVAS_RATE_LIMIT_RETRIES times.
+    """
+    send = requester.request
+    requester._session.hooks['response'].append(lambda response, *args, **kwargs: governor.record(response))
+
+    def request(*args, **kwargs):
+        attempt = 0
+        while True:
+            governor.acquire(_current_priority.get())
+            call_kwargs = dict(kwargs)
+            if call_kwargs.get('_kwargs'):
+                # canvasapi extends this list in place; keep the original intact for retries
+                call_kwargs['_kwargs'] = list(call_kwargs['_kwargs'])
+            try:
+                return send(*args, **call_kwargs)
+            except RateLimitExceeded:
+                attempt += 1
+                if attempt > settings.CANVAS_RATE_LIMIT_RETRIES:
+                    raise
+                print(f"Canvas rate limit exceeded, backing off {governor.delay:.1f}s (attempt {attempt})")
+
+    requester.request = request
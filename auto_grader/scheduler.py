@@ -0,0 +1,212 @@
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from auto_grader.leases import claimable
+from auto_grader.models import Assignment, Submission, SubmissionStatus
+
+
+def poll_interval(due_at, recent_submissions, now):
+    """
+    How long to wait before polling an assignment again.
+
+    - Within GRADER_POLL_DEADLINE_WINDOW of the due date: the minimum interval.
+    - More than GRADER_POLL_CLOSED_AFTER past the due date: the maximum interval.
+    - Otherwise roughly one poll per expected new submission, based on the
+      arrivals of the last GRADER_POLL_RATE_WINDOW, capped at the default
+      interval and never sleeping past the start of the deadline window.
+
+    Args:
+        due_at: Canvas due date of the assignment, or None
+        recent_submissions: Submissions received during the rate window
+        now: Current time
+
+    Returns:
+        timedelta
+    """
+    minimum = timedelta(seconds=settings.GRADER_POLL_MIN_INTERVAL)
+    maximum = timedelta(seconds=settings.GRADER_POLL_MAX_INTERVAL)
+    default = timedelta(seconds=settings.GRADER_POLL_DEFAULT_INTERVAL)
+    deadline_window = timedelta(seconds=settings.GRADER_POLL_DEADLINE_WINDOW)
+
+    if due_at is not None:
+        if now - due_at > timedelta(seconds=settings.GRADER_POLL_CLOSED_AFTER):
+            return maximum
+        if abs(due_at - now) <= deadline_window:
+            return minimum
+
+    interval = default
+    if recent_submissions:
+        rate_window = timedelta(seconds=settings.GRADER_POLL_RATE_WINDOW)
+        interval = min(default, rate_window / recent_submissions)
+
+    if due_at is not None and due_at > now:
+        interval = min(interval, due_at - deadline_window - now)
+    return max(minimum, interval)
+
+
+def due_for_polling(now=None):
+    """Tracked assignments whose next poll time has come (or was never set)"""
+    now = now or timezone.now()
+    return Assignment.objects.filter(user__isnull=False).filter(
+        Q(next_poll_at__isnull=True) | Q(next_poll_at__lte=now)
+    )
+
+
+def schedule_next_polls(assignments, due_dates=None, now=None):
+    """
+    Store due dates and the next poll time of the given assignments.
+
+    Args:
+        assignments: Assignment rows that were just polled
+        due_dates: Optional dict of Canvas assignment ID to due date, as reported by the platform
+        now: Current time
+    """
+    now = now or timezone.now()
+    due_dates = due_dates or {}
+    rate_window = timedelta(seconds=settings.GRADER_POLL_RATE_WINDOW)
+    recent = dict(
+        Submission.objects.filter(
+            assignment__in=assignments,
+            submission_time__gte=now - rate_window,
+        ).values_list('assignment').annotate(count=Count('id'))
+    )
+
+    for assignment in assignments:
+        if assignment.assignment_id in due_dates:
+            assignment.due_at = due_dates[assignment.assignment_id]
+        interval = poll_interval(assignment.due_at, recent.get(assignment.id, 0), now)
+        assignment.next_poll_at = now + interval
+        print(f"Next poll of assignment {assignment.assignment_id} in {interval}")
+    Assignment.objects.bulk_update(assignments, ['due_at', 'next_poll_at'])
+
+
+class FairGradingQueue:
+    """
+    Order in which waiting submissions are graded.
+
+    Each instructor (Assignment.user) has their own queue, sorted by the
+    assignment's grading_priority, then its due date, then submission age.
+    The queues are interleaved by weighted round-robin: every graded
+    submission charges its instructor 1 / grading_weight of virtual time and
+    the instructor with the least virtual time goes next. A large dump from
+    one instructor therefore never delays the others by more than their
+    share. An instructor whose queue was empty restarts at the current
+    minimum, so idle time does not turn into a later burst.
+
+    Submissions backing off after a failed attempt are left out until their
+    next_attempt_at. The time between a submission's arrival and its grading is recorded per
+    instructor and summarized by report().
+
+    Pipeline grading threads charge() while the main thread calls order()
+    and report(), so the in-memory state is guarded by a lock.
+    """
+
+    def __init__(self):
+        self.virtual_time = {}
+        self.floor = 0.0
+        self.waits = {}
+        self._lock = threading.Lock()
+
+    def order(self, limit=None, now=None):
+        """
+        IDs of the submissions ready for grading, in the order they should be graded.
+
+        Args:
+            limit: Optional maximum number of IDs to return
+            now: Current time
+        """
+        return [submission_id for _, _, submission_id, _ in self.entries(now)[:limit]]
+
+    def batches(self, size, now=None):
+        """
+        Submissions ready for grading as groups of up to size IDs of one assignment.
+
+        Groups follow the fair order of their first submission, which pulls
+        the next submissions of the same assignment forward so that a batch
+        prompt is filled even when other instructors' work is interleaved.
+
+        Args:
+            size: Maximum number of IDs per group
+            now: Current time
+
+        Returns:
+            list of lists of submission IDs
+        """
+        entries = self.entries(now)
+        by_assignment = {}
+        for _, _, submission_id, assignment_id in entries:
+            by_assignment.setdefault(assignment_id, []).append(submission_id)
+
+        taken = {assignment_id: 0 for assignment_id in by_assignment}
+        groups = []
+        for _, _, submission_id, assignment_id in entries:
+            position = taken[assignment_id]
+            queue = by_assignment[assignment_id]
+            if position < len(queue) and queue[position] == submission_id:
+                groups.append(queue[position:position + size])
+                taken[assignment_id] = position + size
+        return groups
+
+    @staticmethod
+    def waiting(now):
+        """(ID, submission time, user, priority, weight, due date, assignment ID) of the submissions ready for grading"""
+        return Submission.objects.filter(claimable(SubmissionStatus.NEW, SubmissionStatus.GRADING, now)).filter(
+            Q(next_attempt_at__isnull=True) | Q(next_attempt_at__lte=now)
+        ).values_list(
+            'id', 'submission_time', 'assignment__user_id',
+            'assignment__grading_priority', 'assignment__grading_weight', 'assignment__due_at', 'assignment_id',
+        )
+
+    def entries(self, now=None):
+        """Sorted (virtual time, submission time, ID, assignment ID) of the submissions ready for grading"""
+        queues = {}
+        for row in self.waiting(now or timezone.now()):
+            queues.setdefault(row[2], []).append(row)
+        if not queues:
+            return []
+        with self._lock:
+            # Never moves back, or an instructor returning from idle would replay the time they missed
+            self.floor = max(self.floor, min(self.virtual_time.get(user, self.floor) for user in queues))
+            start = {user: max(self.virtual_time.get(user, self.floor), self.floor) for user in queues}
+
+        entries = []
+        for user, items in queues.items():
+            items.sort(key=lambda row: (-row[3], row[5] is None, row[5] or row[1], row[1], row[0]))
+            virtual_time = start[user]
+            for submission_id, submission_time, _, _, weight, _, assignment_id in items:
+                virtual_time += 1 / max(1, weight)
+                entries.append((virtual_time, submission_time, submission_id, assignment_id))
+        entries.sort()
+        return entries
+
+    def charge(self, submissions, now=None):
+        """Account the grading time of claimed submissions to their instructors"""
+        now = now or timezone.now()
+        with self._lock:
+            for s in submissions:
+                user = s.assignment.user_id if s.assignment else None
+                weight = max(1, s.assignment.grading_weight) if s.assignment else 1
+                self.virtual_time[user] = max(self.virtual_time.get(user, self.floor), self.floor) + 1 / weight
+                self.waits.setdefault(user, []).append((now - s.submission_time).total_seconds())
+
+    def report(self):
+        """Print and reset the queue wait times recorded since the last report"""
+        with self._lock:
+            recorded, self.waits = self.waits, {}
+        for user, waits in recorded.items():
+            print(
+                f"Grading wait for instructor {user}: {len(waits)} submissions, "
+                f"mean {sum(waits) / len(waits):.0f}s, max {max(waits):.0f}s"
+            )
+
+
+def retry_delay(attempts):
+    """Backoff before the next grading attempt: doubling from GRADER_RETRY_BASE_DELAY up to GRADER_RETRY_MAX_DELAY"""
+    return timedelta(seconds=min(
+        settings.GRADER_RETRY_MAX_DELAY,
+        settings.GRADER_RETRY_BASE_DELAY * 2 ** max(0, attempts - 1),
+    ))
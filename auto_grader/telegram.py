@@ -1,8 +1,9 @@
+from asgiref.sync import sync_to_async
 from django.conf import settings
 from telegram import Update
 from telegram.ext import Application, CommandHandler, CallbackQueryHandler, filters
 
-from auto_grader.canvas import CanvasGrader
+from auto_grader.canvas import canvas_grader_for
 from auto_grader.models import User, Submission, Assignment, SubmissionStatus, Platform
 
 
@@ -30,12 +31,28 @@ async def get_grade_callback(update: Update, context):
         
         # Update submission grade
         submission.grade = grade
-        
+
+        if settings.CANVAS_BATCH_GRADE_POSTING:
+            # grader_job posts approved grades in bulk, one request per assignment
+            submission.status = SubmissionStatus.APPROVED
+            await submission.asave()
+
+            await query.answer(
+                text=f'You selected {grade} for {submission.student_name}. Grade queued for posting.',
+            )
+            await query.edit_message_text(
+                query.message.text_html_urled + f'\n\n🕒 <b>Grade {grade} queued for {submission.student_name}</b>',
+                parse_mode='HTML',
+                reply_markup=None
+            )
+            return
+
         # Send grade to platform
         platform = await Platform.objects.aget(id=assignment.platform_id)
         if platform and platform.name == 'Canvas':
-            canvas_grader = CanvasGrader(platform.api_url, platform.api_key)
-            canvas_grader.send_grade(
+            canvas_grader = canvas_grader_for(platform)
+            # Run in a worker thread so rate limit back-off does not block the bot's event loop
+            await sync_to_async(canvas_grader.send_grade)(
                 course_id=assignment.course_id,
                 assignment_id=assignment.assignment_id,
                 student_nid=submission.student_nid,
@@ -72,6 +89,9 @@ async def regenerate_callback(update: Update, context):
     submission.status = SubmissionStatus.NEW
     submission.grade = None
     submission.feedback = ""
+    submission.attempts = 0
+    submission.next_attempt_at = None
+    submission.last_error = ""
     await submission.asave()
     
     await query.answer(text='Regenerating feedback...')
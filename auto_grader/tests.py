@@ -1,3 +1,284 @@
+import re
+from datetime import timedelta
+from types import SimpleNamespace
+from unittest import mock
+
+from django.db import connection
+from django.db.models import Count
 from django.test import TestCase
+from django.utils import timezone
+
+from auto_grader.leases import claim_submissions, release_submission, waiting_ids
+from auto_grader.management.commands.grader_job import Command
+from auto_grader.models import Assignment, Submission, SubmissionEvent, SubmissionStatus, User
+from auto_grader.scheduler import FairGradingQueue
+
+# Plan lines that read a whole table instead of seeking an index
+FULL_SCAN = {
+    'sqlite': re.compile(r'\bSCAN (auto_grader_\w+)(?! USING (COVERING )?INDEX)'),
+    'postgresql': re.compile(r'Seq Scan on (auto_grader_\w+)'),
+}
+
+
+class HotQueryPlanTests(TestCase):
+    """
+    EXPLAIN the queries grader_job, the bot and the admin run on every cycle
+    against a large seeded history, and fail if any of them scans a table.
+    """
+
+    ASSIGNMENTS = 20
+    SUBMISSIONS_PER_ASSIGNMENT = 500
+
+    @classmethod
+    def setUpTestData(cls):
+        now = timezone.now()
+        cls.assignments = Assignment.objects.bulk_create(
+            Assignment(course_id=1, assignment_id=i) for i in range(cls.ASSIGNMENTS)
+        )
+        # Mostly finished history with a small live backlog, like a long-running deployment
+        statuses = [SubmissionStatus.GRADE_POSTED] * 95 + [
+            SubmissionStatus.NEW, SubmissionStatus.GRADING, SubmissionStatus.GRADED,
+            SubmissionStatus.VERIFICATION_SENT, SubmissionStatus.APPROVED,
+        ]
+        Submission.objects.bulk_create(
+            Submission(
+                assignment=assignment,
+                student_id=str(i),
+                student_name=f'Student {i}',
+                submission_time=now - timedelta(minutes=i),
+                content='',
+                status=statuses[i % len(statuses)],
+            )
+            for assignment in cls.assignments
+            for i in range(cls.SUBMISSIONS_PER_ASSIGNMENT)
+        )
+        SubmissionEvent.objects.bulk_create(
+            SubmissionEvent(
+                assignment=cls.assignments[i % cls.ASSIGNMENTS],
+                student_nid=i,
+                event_name='submission_created',
+                processed_at=now if i % 50 else None,
+            )
+            for i in range(5000)
+        )
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+
+    def assertNoFullScan(self, queryset):
+        pattern = FULL_SCAN.get(connection.vendor)
+        if pattern is None:
+            self.skipTest(f'No plan check for {connection.vendor}')
+        plan = queryset.explain()
+        self.assertIsNone(pattern.search(plan), f'Full table scan in plan:\n{plan}\nfor query:\n{queryset.query}')
+
+    def test_ungraded_count(self):
+        self.assertNoFullScan(Submission.objects.filter(status=SubmissionStatus.NEW))
+
+    def test_grading_claim_candidates(self):
+        self.assertNoFullScan(FairGradingQueue.waiting(timezone.now()))
+
+    def test_notification_claim_candidates(self):
+        self.assertNoFullScan(waiting_ids(SubmissionStatus.GRADED, SubmissionStatus.NOTIFYING))
+
+    def test_claimed_batch(self):
+        self.assertNoFullScan(
+            Submission.objects.filter(id__in=[1, 2, 3]).select_related(
+                'assignment', 'assignment__user', 'assignment__platform'
+            ).order_by('id')
+        )
+
+    def test_approved_grades(self):
+        self.assertNoFullScan(
+            Submission.objects.filter(status=SubmissionStatus.APPROVED).select_related('assignment', 'assignment__platform')
+        )
+
+    def test_assignment_status_count(self):
+        self.assertNoFullScan(
+            Submission.objects.filter(assignment=self.assignments[0], status=SubmissionStatus.GRADED)
+        )
+
+    def test_duplicate_submission_lookup(self):
+        self.assertNoFullScan(
+            Submission.objects.filter(
+                assignment=self.assignments[0], student_nid=7, submission_time=timezone.now()
+            )
+        )
+
+    def test_recent_arrivals(self):
+        self.assertNoFullScan(
+            Submission.objects.filter(
+                assignment__in=self.assignments[:3],
+                submission_time__gte=timezone.now() - timedelta(hours=6),
+            ).values_list('assignment').annotate(count=Count('id'))
+        )
+
+    def test_pending_events(self):
+        self.assertNoFullScan(
+            SubmissionEvent.objects.filter(processed_at__isnull=True).order_by('received_at')
+        )
+
+
+def create_submissions(assignment, count, **fields):
+    """count NEW submissions of an assignment, oldest first"""
+    now = timezone.now()
+    return Submission.objects.bulk_create(
+        Submission(
+            assignment=assignment,
+            student_id=str(i),
+            student_name=f'Student {i}',
+            submission_time=now - timedelta(minutes=count - i),
+            content='',
+            **fields,
+        )
+        for i in range(count)
+    )
+
+
+class LeaseTests(TestCase):
+    """Claims and releases of work queue rows by competing workers"""
+
+    def setUp(self):
+        self.assignment = Assignment.objects.create(course_id=1, assignment_id=1)
+        create_submissions(self.assignment, 5)
+
+    def claim(self, worker_id, limit=5):
+        return claim_submissions(SubmissionStatus.NEW, SubmissionStatus.GRADING, worker_id, limit)
+
+    def expire_leases(self):
+        Submission.objects.filter(status=SubmissionStatus.GRADING).update(
+            lease_expires_at=timezone.now() - timedelta(seconds=1)
+        )
+
+    def test_two_workers_never_share_rows(self):
+        first = self.claim('worker-a', limit=3)
+        second = self.claim('worker-b')
+        self.assertEqual(len(first), 3)
+        self.assertEqual(len(second), 2)
+        self.assertFalse({s.id for s in first} & {s.id for s in second})
+        self.assertEqual(self.claim('worker-c'), [])
+
+    def test_expired_lease_is_reclaimed(self):
+        self.claim('worker-a')
+        self.assertEqual(self.claim('worker-b'), [])
+
+        self.expire_leases()
+        reclaimed = self.claim('worker-b')
+        self.assertEqual(len(reclaimed), 5)
+        self.assertTrue(all(s.claimed_by == 'worker-b' for s in reclaimed))
+
+    def test_threads_of_one_worker_keep_their_own_claims(self):
+        ids = list(Submission.objects.order_by('id').values_list('id', flat=True))
+        # Pipeline threads share a worker_id and can claim within the same clock tick
+        with mock.patch('auto_grader.leases.timezone.now', return_value=timezone.now()):
+            first = claim_submissions(SubmissionStatus.NEW, SubmissionStatus.GRADING, 'worker-a', 2, ids=ids[:2])
+            second = claim_submissions(SubmissionStatus.NEW, SubmissionStatus.GRADING, 'worker-a', 1, ids=ids[2:3])
+        self.assertEqual([s.id for s in first], ids[:2])
+        self.assertEqual([s.id for s in second], ids[2:3])
+
+    def test_lost_lease_discards_result(self):
+        stale = self.claim('worker-a', limit=1)[0]
+        self.expire_leases()
+        self.claim('worker-b', limit=1)
+
+        released = release_submission(
+            stale, 'worker-a', SubmissionStatus.GRADING, SubmissionStatus.GRADED, grade='5'
+        )
+        self.assertFalse(released)
+        stale.refresh_from_db()
+        self.assertEqual(stale.status, SubmissionStatus.GRADING)
+        self.assertEqual(stale.claimed_by, 'worker-b')
+        self.assertIsNone(stale.grade)
+
+
+class FairGradingQueueTests(TestCase):
+    """Order in which waiting submissions are handed to the grader"""
+
+    def setUp(self):
+        self.heavy = Assignment.objects.create(
+            course_id=1, assignment_id=1, user=User.objects.create(user_id=1), grading_weight=2,
+        )
+        self.light = Assignment.objects.create(course_id=1, assignment_id=2, user=User.objects.create(user_id=2))
+
+    def assignments_in_order(self, queue):
+        assignment_of = dict(Submission.objects.values_list('id', 'assignment_id'))
+        return [assignment_of[submission_id] for submission_id in queue.order()]
+
+    def test_instructors_are_interleaved_by_weight(self):
+        create_submissions(self.heavy, 6)
+        create_submissions(self.light, 6)
+
+        order = self.assignments_in_order(FairGradingQueue())
+        # Twice the weight, twice the share of every prefix
+        self.assertEqual(order[:6].count(self.heavy.id), 4)
+        self.assertEqual(order[-3:], [self.light.id] * 3)
+
+    def test_idle_time_is_not_replayed(self):
+        queue = FairGradingQueue()
+        returning = create_submissions(self.light, 1)
+        queue.charge(Submission.objects.filter(id=returning[0].id).select_related('assignment'))
+        Submission.objects.all().delete()
+
+        # The other instructor keeps grading while this one is idle
+        for _ in range(5):
+            create_submissions(self.heavy, 2)
+            queue.order()
+            queue.charge(Submission.objects.select_related('assignment'))
+            Submission.objects.all().delete()
+
+        create_submissions(self.heavy, 4)
+        create_submissions(self.light, 4)
+        order = self.assignments_in_order(queue)
+        self.assertLessEqual(order[:3].count(self.light.id), 1)
+
+    def test_priority_goes_first_within_an_instructor(self):
+        urgent = Assignment.objects.create(course_id=1, assignment_id=3, user=self.light.user, grading_priority=1)
+        create_submissions(self.light, 2)
+        create_submissions(urgent, 2)
+
+        self.assertEqual(self.assignments_in_order(FairGradingQueue()), [urgent.id] * 2 + [self.light.id] * 2)
+
+    def test_backing_off_submissions_are_skipped(self):
+        now = timezone.now()
+        waiting, backing_off = create_submissions(self.light, 2)
+        backing_off.next_attempt_at = now + timedelta(minutes=5)
+        backing_off.save()
+
+        queue = FairGradingQueue()
+        self.assertEqual(queue.order(now=now), [waiting.id])
+        self.assertEqual(queue.order(now=now + timedelta(minutes=10)), [waiting.id, backing_off.id])
+
+    def test_batches_hold_one_assignment(self):
+        create_submissions(self.heavy, 5)
+        create_submissions(self.light, 3)
+
+        batches = FairGradingQueue().batches(2)
+        assignment_of = dict(Submission.objects.values_list('id', 'assignment_id'))
+        self.assertEqual([len(batch) for batch in batches], [2, 2, 2, 1, 1])
+        for batch in batches:
+            self.assertEqual(len({assignment_of[submission_id] for submission_id in batch}), 1)
+        self.assertEqual(sorted(i for batch in batches for i in batch), sorted(assignment_of))
+
+
+class BatchResponseTests(TestCase):
+    """Parsing of "<id> | <grade>: <feedback>" batch grading replies"""
+
+    batch = [SimpleNamespace(id=11), SimpleNamespace(id=12), SimpleNamespace(id=13)]
+
+    def test_parses_each_submission(self):
+        response = "11 | 5: Correct.\n12 | 3: Missing the base case: see line 4."
+        self.assertEqual(
+            Command.parse_batch_response(response, self.batch),
+            {11: ('5', 'Correct.'), 12: ('3', 'Missing the base case: see line 4.')},
+        )
+
+    def test_tolerates_markdown(self):
+        response = "Here are the grades:\n\n- **11** | 4: Good.\n`12` | 2 : Off by one.\n"
+        self.assertEqual(
+            Command.parse_batch_response(response, self.batch),
+            {11: ('4', 'Good.'), 12: ('2', 'Off by one.')},
+        )
 
-# Create your tests here.
+    def test_ignores_unknown_ids_and_repeats(self):
+        response = "99 | 5: Not in this batch.\n13 | 1: First.\n13 | 5: Second."
+        self.assertEqual(Command.parse_batch_response(response, self.batch), {13: ('1', 'First.')})
@@ -1,9 +1,103 @@
+import hashlib
+import hmac
+import json
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
 from django.shortcuts import render
-from django.http import JsonResponse
+from django.http import HttpResponseNotModified, JsonResponse
+from django.views.decorators.http import require_POST
 from django.views.decorators.csrf import csrf_exempt
 from django.contrib.admin.views.decorators import staff_member_required
-from .models import Platform
-from .canvas import CanvasGrader
+from .models import Assignment, Platform, SubmissionEvent
+from .canvas import canvas_grader_for, credentials_fingerprint
+
+_refreshing = set()
+_refreshing_lock = threading.Lock()
+
+
+def load_choices(key, loader):
+    """Fetch choices from the platform and store them with their fetch time and ETag"""
+    choices = loader()
+    entry = {
+        'choices': choices,
+        'fetched_at': time.time(),
+        'etag': hashlib.sha1(json.dumps(choices).encode()).hexdigest(),
+    }
+    # An empty list usually means the Canvas call failed, so don't pin it in the cache
+    if choices:
+        cache.set(key, entry, settings.ADMIN_CHOICES_CACHE_TTL)
+    return entry
+
+
+def refresh_in_background(key, loader):
+    """Reload a stale cache entry on a daemon thread, at most one refresh per key at a time"""
+    with _refreshing_lock:
+        if key in _refreshing:
+            return
+        _refreshing.add(key)
+
+    def refresh():
+        try:
+            load_choices(key, loader)
+        except Exception as e:
+            import logging
+            logging.getLogger(__name__).error(f"Error refreshing {key}: {str(e)}")
+        finally:
+            with _refreshing_lock:
+                _refreshing.discard(key)
+
+    threading.Thread(target=refresh, daemon=True).start()
+
+
+def cached_choices(key, loader):
+    """
+    Serve choices from the cache, refreshing entries older than
+    ADMIN_CHOICES_FRESH_SECONDS in the background (stale-while-revalidate).
+    """
+    entry = cache.get(key)
+    if entry is None:
+        return load_choices(key, loader)
+    if time.time() - entry['fetched_at'] > settings.ADMIN_CHOICES_FRESH_SECONDS:
+        refresh_in_background(key, loader)
+    return entry
+
+
+def choices_response(request, field, entry, **extra):
+    """
+    Build a JSON response for a dropdown, filtered by ?q= and paginated by ?page=.
+
+    Without a page parameter every matching choice is returned. Answers
+    304 Not Modified when the client's If-None-Match matches.
+    """
+    etag = '"{}"'.format(hashlib.sha1(f"{entry['etag']}?{request.GET.urlencode()}".encode()).hexdigest())
+    if request.headers.get('If-None-Match') == etag:
+        response = HttpResponseNotModified()
+        response['ETag'] = etag
+        return response
+
+    choices = entry['choices']
+    search = request.GET.get('q', '').strip().lower()
+    if search:
+        choices = [choice for choice in choices if search in choice[1].lower()]
+
+    payload = {field: choices, 'total': len(choices), **extra}
+    page = request.GET.get('page')
+    if page:
+        page = max(1, int(page))
+        page_size = int(request.GET.get('page_size', settings.ADMIN_CHOICES_PAGE_SIZE))
+        start = (page - 1) * page_size
+        payload[field] = choices[start:start + page_size]
+        payload['page'] = page
+        payload['has_more'] = start + page_size < len(choices)
+
+    response = JsonResponse(payload)
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
 
 @staff_member_required
 def get_courses_for_platform(request):
@@ -22,10 +116,11 @@ def get_courses_for_platform(request):
         logger.info(f"Found platform: {platform.name}")
         
         if platform.api_key and platform.api_url:
-            grader = CanvasGrader(platform.api_url, platform.api_key)
-            courses = grader.get_courses()
-            logger.info(f"Retrieved {len(courses)} courses")
-            return JsonResponse({'courses': courses, 'platform_name': platform.name})
+            grader = canvas_grader_for(platform)
+            key = f'admin-courses:{platform.pk}:{credentials_fingerprint(platform.api_url, platform.api_key)}'
+            entry = cached_choices(key, grader.get_courses)
+            logger.info(f"Serving {len(entry['choices'])} courses")
+            return choices_response(request, 'courses', entry, platform_name=platform.name)
         else:
             return JsonResponse({'courses': [], 'debug': 'Platform missing API key or URL'})
     except Platform.DoesNotExist:
@@ -46,12 +141,58 @@ def get_assignments_for_course(request):
     try:
         platform = Platform.objects.get(id=platform_id)
         if platform.api_key and platform.api_url:
-            grader = CanvasGrader(platform.api_url, platform.api_key)
-            assignments = grader.get_assignments_for_course(course_id)
-            return JsonResponse({'assignments': assignments})
+            grader = canvas_grader_for(platform)
+            key = f'admin-assignments:{platform.pk}:{credentials_fingerprint(platform.api_url, platform.api_key)}:{int(course_id)}'
+            entry = cached_choices(key, lambda: grader.get_assignments_for_course(course_id))
+            return choices_response(request, 'assignments', entry)
         else:
             return JsonResponse({'assignments': []})
     except Platform.DoesNotExist:
         return JsonResponse({'assignments': []})
     except Exception as e:
         return JsonResponse({'assignments': [], 'error': str(e)})
+
+
+def canvas_local_id(value):
+    """Canvas live events may carry global IDs (shard * 10**13 + local ID); reduce them to local IDs"""
+    return int(value) % 10 ** 13
+
+
+@csrf_exempt
+@require_POST
+def canvas_submission_event(request):
+    """
+    Endpoint for Canvas "submission_created"/"submission_updated" live events.
+
+    Each event queues that one submission for immediate ingestion by grader_job.
+    Requests must send "Authorization: Bearer <CANVAS_EVENTS_TOKEN>".
+    """
+    token = settings.CANVAS_EVENTS_TOKEN
+    if not token:
+        return JsonResponse({'error': 'Event ingestion is not configured'}, status=503)
+    if not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return JsonResponse({'error': 'Invalid token'}, status=403)
+
+    try:
+        event = json.loads(request.body)
+        event_name = event['metadata']['event_name']
+        body = event['body']
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'error': 'Malformed event'}, status=400)
+
+    if event_name not in ('submission_created', 'submission_updated'):
+        return JsonResponse({'queued': 0, 'ignored': event_name})
+
+    try:
+        assignment_id = canvas_local_id(body['assignment_id'])
+        student_nid = canvas_local_id(body['user_id'])
+    except (KeyError, TypeError, ValueError):
+        return JsonResponse({'error': 'Event is missing assignment_id or user_id'}, status=400)
+
+    assignments = Assignment.objects.filter(assignment_id=assignment_id, user__isnull=False)
+    events = [
+        SubmissionEvent(assignment=assignment, student_nid=student_nid, event_name=event_name)
+        for assignment in assignments
+    ]
+    SubmissionEvent.objects.bulk_create(events)
+    return JsonResponse({'queued': len(events)}, status=202)